@@ -1,6 +1,5 @@
 import re
-import aiohttp
-from typing import Dict, List
+from typing import Dict, List, Optional
 from extractors.base_extractor import BaseExtractor
 
 class AppxExtractor(BaseExtractor):
@@ -9,25 +8,28 @@ class AppxExtractor(BaseExtractor):
     def is_valid_url(self, url: str) -> bool:
         return bool(re.match(r'https?://(www\.)?appx\.com/.+', url))
     
-    async def extract(self, url: str) -> Dict:
+    async def extract_content(self, url: str) -> Dict:
         """Extract content from Appx without login"""
         # First get the course page to find API endpoints
-        async with aiohttp.ClientSession() as session:
-            # Step 1: Get course ID from URL
-            course_id = self._extract_course_id(url)
-            if not course_id:
-                raise Exception("Could not extract course ID from URL")
+        session = await self.get_session()
+        # Step 1: Get course ID from URL
+        course_id = self._extract_course_id(url)
+        if not course_id:
+            raise Exception("Could not extract course ID from URL")
+        
+        # Step 2: Call Appx API to get course content
+        api_url = f"https://api.appx.com/v1/courses/{course_id}/public"
+        async with session.get(api_url) as response:
+            if response.status != 200:
+                raise Exception(f"Appx API error: HTTP {response.status}")
+            
+            data = await response.json()
             
-            # Step 2: Call Appx API to get course content
-            api_url = f"https://api.appx.com/v1/courses/{course_id}/public"
-            async with session.get(api_url) as response:
-                if response.status != 200:
-                    raise Exception(f"Appx API error: HTTP {response.status}")
-                
-                data = await response.json()
-                
-                # Step 3: Process course content
-                return self._parse_course_content(data)
+            # Step 3: Process course content
+            return self._parse_course_content(data)
+    
+    def cache_id(self, url: str) -> str:
+        return self._extract_course_id(url) or super().cache_id(url)
     
     def _extract_course_id(self, url: str) -> Optional[str]:
         """Extract course ID from Appx URL"""
@@ -65,7 +67,8 @@ class AppxExtractor(BaseExtractor):
                 {
                     'resolution': q.get('quality', 'Unknown'),
                     'url': q['url'],
-                    'size': self._format_size(q.get('size_bytes', 0))
+                    'size': self._format_size(q.get('size_bytes', 0)),
+                    'size_bytes': q.get('size_bytes', 0)
                 }
                 for q in content['qualities']
             ]
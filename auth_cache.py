@@ -0,0 +1,121 @@
+import os
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_INTERVAL = 30
+
+
+class AuthorizationCache:
+    """
+    In-memory set of authorized user ids
+
+    Loaded once at startup and then kept current from a MongoDB change stream
+    on the users collection, opened before the load so nothing changed in
+    between is missed. Deployments without change streams (standalone
+    mongod) fall back to reloading the set every `poll_interval` seconds,
+    which bounds staleness. Admin commands update the set directly so their
+    effect is immediate; updates made while a reload is reading are applied
+    on top of what it read.
+    """
+
+    def __init__(self, db, admin_ids: Iterable[int] = (), poll_interval: Optional[float] = None):
+        self.db = db
+        self.admin_ids = set(admin_ids)
+        self.poll_interval = poll_interval or float(os.getenv("AUTH_POLL_INTERVAL", DEFAULT_POLL_INTERVAL))
+        self._authorized: Set[int] = set()
+        # Updates seen by each reload in progress
+        self._reloads: List[Dict[int, bool]] = []
+        self._stop = threading.Event()
+        self._watcher: Optional[asyncio.Task] = None
+
+    def is_authorized(self, user_id: int) -> bool:
+        return user_id in self.admin_ids or user_id in self._authorized
+
+    def set_authorized(self, user_id: int, authorized: bool):
+        for changes in self._reloads:
+            changes[user_id] = authorized
+        if authorized:
+            self._authorized.add(user_id)
+        else:
+            self._authorized.discard(user_id)
+
+    async def reload(self):
+        changes: Dict[int, bool] = {}
+        self._reloads.append(changes)
+        try:
+            authorized = set(await self.db.get_authorized_user_ids())
+        finally:
+            self._reloads.remove(changes)
+        # The read may predate these, so they win
+        for user_id, is_authorized in changes.items():
+            if is_authorized:
+                authorized.add(user_id)
+            else:
+                authorized.discard(user_id)
+        self._authorized = authorized
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._stop.clear()
+        stream = None
+        try:
+            stream = await loop.run_in_executor(None, self._open_change_stream)
+        except OperationFailure as e:
+            logger.info(f"Change streams unavailable ({str(e)}), polling authorized users instead")
+        except Exception as e:
+            logger.warning(f"Authorization change stream failed ({str(e)}), polling instead")
+        try:
+            await self.reload()
+        except BaseException:
+            if stream is not None:
+                stream.close()
+            raise
+        logger.info(f"Loaded {len(self._authorized)} authorized users")
+        self._watcher = asyncio.ensure_future(self._watch(stream))
+
+    async def stop(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+    async def _watch(self, stream):
+        if stream is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self._follow_change_stream, stream, loop)
+            except Exception as e:
+                logger.warning(f"Authorization change stream failed ({str(e)}), polling instead")
+        await self._poll()
+
+    def _open_change_stream(self):
+        """Blocking; raises OperationFailure where change streams aren't supported"""
+        pipeline = [{'$match': {'operationType': {'$in': ['insert', 'update', 'replace', 'delete']}}}]
+        return self.db.db.users.watch(pipeline, full_document='updateLookup', max_await_time_ms=1000)
+
+    def _follow_change_stream(self, stream, loop: asyncio.AbstractEventLoop):
+        """Blocking change stream reader, runs on an executor thread"""
+        with stream:
+            while not self._stop.is_set():
+                change = stream.try_next()
+                if change is None:
+                    continue
+                user = change.get('fullDocument')
+                if user and 'user_id' in user:
+                    loop.call_soon_threadsafe(self.set_authorized, user['user_id'], bool(user.get('authorized')))
+                else:
+                    # Deletes only carry the document _id, so resync the whole set
+                    asyncio.run_coroutine_threadsafe(self.reload(), loop)
+
+    async def _poll(self):
+        while not self._stop.is_set():
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Failed to reload authorized users: {str(e)}")
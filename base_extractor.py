@@ -1,6 +1,36 @@
+import aiohttp
 from abc import ABC, abstractmethod
+from typing import Optional
+from utilities.http_client import get_http_client
+from utilities.url_utils import normalize_url
+from utilities.extract_cache import get_extraction_cache
 
 class BaseExtractor(ABC):
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        self._session = session
+    
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Get the injected session, or the shared application-wide one"""
+        if self._session is not None:
+            return self._session
+        return await get_http_client().get_session()
+    
+    async def extract(self, url: str) -> dict:
+        """
+        Extract content from the given URL
+        Results are served from the extraction cache while still fresh
+        """
+        return await get_extraction_cache().get_or_fetch(
+            self.PLATFORM, self.cache_id(url), lambda: self.extract_content(url)
+        )
+    
+    def cache_id(self, url: str) -> str:
+        """
+        Identify the resource behind the URL for caching
+        Override when several URLs resolve to the same course
+        """
+        return normalize_url(url)
+    
     @abstractmethod
     async def extract_content(self, url: str) -> dict:
         """
@@ -0,0 +1,108 @@
+"""
+Load test for the async, batched MongoDB layer
+
+Simulates many concurrent handlers logging requests and compares the old
+pattern (a blocking insert_one on the event loop per request) with
+MongoDB.log_request. Extra round-trip latency can be injected to mimic a
+remote cluster; handler latency should stay flat for the batched layer while
+it grows with Mongo latency for the blocking one.
+
+Usage: python bench_db.py [--uri mongodb://localhost:27017] [--latency-ms 0,20,80]
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+from typing import List
+
+from utilities.database import MongoDB
+
+BENCH_DB = "course_extractor_bot_bench"
+
+
+class _SlowCollection:
+    """Adds a fixed delay to every write to emulate network round-trips"""
+
+    def __init__(self, collection, latency: float):
+        self._collection = collection
+        self._latency = latency
+
+    def insert_one(self, *args, **kwargs):
+        time.sleep(self._latency)
+        return self._collection.insert_one(*args, **kwargs)
+
+    def insert_many(self, *args, **kwargs):
+        time.sleep(self._latency)
+        return self._collection.insert_many(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class _SlowDatabase:
+    def __init__(self, database, latency: float):
+        self._database = database
+        self._latency = latency
+
+    def __getattr__(self, name):
+        return _SlowCollection(getattr(self._database, name), self._latency)
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def _drive(handler, handlers: int, per_handler: int) -> List[float]:
+    latencies = []
+
+    async def one(user_id: int):
+        for i in range(per_handler):
+            start = time.perf_counter()
+            await handler(user_id, i)
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0)
+
+    await asyncio.gather(*(one(u) for u in range(handlers)))
+    return latencies
+
+
+async def run(uri: str, latency: float, handlers: int, per_handler: int):
+    db = MongoDB(uri, db_name=BENCH_DB)
+    await db.start()
+    db.db = _SlowDatabase(db.db, latency)
+
+    async def blocking_handler(user_id: int, i: int):
+        # The old Database.log_request: one blocking insert_one per request
+        db.db.requests.insert_one({'user_id': user_id, 'platform': 'bench', 'course_name': str(i)})
+
+    async def batched_handler(user_id: int, i: int):
+        await db.log_request(user_id, 'bench', str(i))
+
+    blocking = await _drive(blocking_handler, handlers, per_handler)
+    batched = await _drive(batched_handler, handlers, per_handler)
+    await db.flush()
+
+    db.client.drop_database(BENCH_DB)
+    await db.close()
+
+    for name, samples in (('blocking', blocking), ('batched', batched)):
+        print(f"{latency * 1000:>6.0f}ms  {name:<9} p50={statistics.median(samples) * 1000:8.3f}ms  "
+              f"p99={_percentile(samples, 0.99) * 1000:8.3f}ms  total={sum(samples):7.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uri', default=os.getenv("MONGODB_URI", "mongodb://localhost:27017"))
+    parser.add_argument('--latency-ms', default='0,20,80', help='comma-separated injected latencies')
+    parser.add_argument('--handlers', type=int, default=50, help='concurrent simulated handlers')
+    parser.add_argument('--requests', type=int, default=20, help='requests per handler')
+    args = parser.parse_args()
+
+    for latency_ms in [float(v) for v in args.latency_ms.split(',')]:
+        asyncio.run(run(args.uri, latency_ms / 1000, args.handlers, args.requests))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Peak memory benchmark for the chunked DRM container
+
+Encrypts files of increasing size in fresh subprocesses and reports the peak
+RSS of each run. With streaming encryption the peak should stay flat while
+the file size grows.
+
+With --stream the file is served over local HTTP instead, and downloading to
+disk followed by encrypt_file is compared with the single-pass streaming path
+(DRM_STREAMING=1), including the file bytes each one writes and reads back.
+
+Usage: python bench_drm.py [--sizes 64,256,1024] [--dir /tmp] [--stream]
+"""
+import os
+import sys
+import time
+import json
+import asyncio
+import argparse
+import resource
+import subprocess
+import tempfile
+
+
+def _make_file(path: str, size_mb: int):
+    block = os.urandom(1024 * 1024)
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def _run_single(input_file: str):
+    from utilities.drm_utils import encrypt_file, generate_key, ChunkedDecryptor
+
+    key = generate_key()
+    output_file = input_file + ".drm"
+    start = time.perf_counter()
+    size = encrypt_file(input_file, output_file, key)
+    elapsed = time.perf_counter() - start
+
+    # Spot-check random access on the result
+    with ChunkedDecryptor(output_file, key) as reader:
+        assert reader.plaintext_size == size
+        reader.read(size // 2, 4096)
+    os.remove(output_file)
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'bytes': size, 'seconds': elapsed, 'peak_rss_kb': peak_kb}))
+
+
+def _io_counters() -> dict:
+    """Bytes this process moved through read()/write() calls (Linux only)"""
+    try:
+        with open('/proc/self/io') as f:
+            return {name: int(value) for name, value in (line.split(': ') for line in f)}
+    except OSError:
+        return {}
+
+
+async def _fetch_then_encrypt(url: str, output_file: str, key: bytes) -> int:
+    import aiohttp
+    from utilities.downloader import SegmentedDownloader
+    from utilities.drm_utils import encrypt_file
+
+    plain_file = output_file + ".plain"
+    async with aiohttp.ClientSession() as session:
+        await SegmentedDownloader(session, segments=1).download(url, plain_file)
+    size = encrypt_file(plain_file, output_file, key)
+    os.remove(plain_file)
+    return size
+
+
+async def _stream(url: str, output_file: str, key: bytes) -> int:
+    import aiohttp
+    from utilities.drm_utils import stream_encrypt_url
+
+    async with aiohttp.ClientSession() as session:
+        return (await stream_encrypt_url(url, output_file, key, session=session))['size']
+
+
+def _run_stream(url: str, mode: str, scratch: str):
+    from utilities.drm_utils import generate_key
+
+    key = generate_key()
+    output_file = os.path.join(scratch, f"bench_drm_{mode}.drm")
+    before = _io_counters()
+    start = time.perf_counter()
+    run = _stream if mode == 'stream' else _fetch_then_encrypt
+    size = asyncio.run(run(url, output_file, key))
+    elapsed = time.perf_counter() - start
+    after = _io_counters()
+    os.remove(output_file)
+
+    print(json.dumps({
+        'bytes': size,
+        'seconds': elapsed,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        # Socket receives (recv) aren't counted, so this is file traffic
+        'written': after.get('wchar', 0) - before.get('wchar', 0),
+        'read': after.get('rchar', 0) - before.get('rchar', 0),
+    }))
+
+
+async def _compare_stream(args, size_mb: int, input_file: str):
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get('/video.mp4', lambda request: web.FileResponse(input_file))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        for mode in ('download+encrypt', 'stream'):
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, __file__, '--single-stream', f"http://127.0.0.1:{port}/video.mp4",
+                '--mode', mode, '--dir', args.dir, stdout=asyncio.subprocess.PIPE
+            )
+            out, _ = await process.communicate()
+            if process.returncode:
+                raise Exception(f"{mode} run failed")
+            r = json.loads(out.decode().strip().splitlines()[-1])
+            print(f"{size_mb:>6}MB  {mode:<17} {r['seconds']:>7.2f}s  {r['peak_rss_kb'] / 1024:>8.1f}MB  "
+                  f"{r['written'] / 2 ** 20:>9.1f}MB  {r['read'] / 2 ** 20:>9.1f}MB")
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='64,256,1024', help='comma-separated file sizes in MB')
+    parser.add_argument('--dir', default=tempfile.gettempdir(), help='scratch directory')
+    parser.add_argument('--stream', action='store_true', help='compare download+encrypt with streaming over HTTP')
+    parser.add_argument('--single', help=argparse.SUPPRESS)
+    parser.add_argument('--single-stream', help=argparse.SUPPRESS)
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        _run_single(args.single)
+        return
+    if args.single_stream:
+        _run_stream(args.single_stream, args.mode, args.dir)
+        return
+
+    if args.stream:
+        print(f"{'size':>8}  {'mode':<17} {'time':>8}  {'peak RSS':>10}  {'written':>10}  {'read':>10}")
+        for size_mb in [int(s) for s in args.sizes.split(',')]:
+            input_file = os.path.join(args.dir, f"bench_drm_{size_mb}mb.bin")
+            _make_file(input_file, size_mb)
+            try:
+                asyncio.run(_compare_stream(args, size_mb, input_file))
+            finally:
+                os.remove(input_file)
+        return
+
+    print(f"{'size':>8}  {'time':>8}  {'MB/s':>8}  {'peak RSS':>10}")
+    for size_mb in [int(s) for s in args.sizes.split(',')]:
+        input_file = os.path.join(args.dir, f"bench_drm_{size_mb}mb.bin")
+        _make_file(input_file, size_mb)
+        try:
+            out = subprocess.run(
+                [sys.executable, __file__, '--single', input_file],
+                check=True, capture_output=True, text=True
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+        finally:
+            os.remove(input_file)
+        print(f"{size_mb:>6}MB  {result['seconds']:>7.2f}s  "
+              f"{size_mb / result['seconds']:>8.1f}  {result['peak_rss_kb'] / 1024:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
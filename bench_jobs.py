@@ -0,0 +1,150 @@
+"""
+Tail latency of single-link requests under a mixed load
+
+A few users submit large portals while others keep sending single links.
+Every link costs one blocking unit of work on a shared download pool, like a
+yt-dlp download. The same arrivals are run twice:
+
+- inline: each request starts immediately in its handler (the old behaviour)
+- queued: requests go through JobScheduler with per-user fair sharing and
+  single links prioritized over portals
+
+and the latency of single links (arrival to completion) is reported.
+
+Usage: python bench_jobs.py [--portals 3] [--links 300] [--singles 60] [--uri mongodb://localhost:27017]
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from typing import Dict, List
+
+from utilities.worker_pool import DownloadWorkerPool
+from utilities.portal_builder import PortalBuilder
+from utilities.job_queue import (
+    JobScheduler, MongoJobStore, SQLiteJobStore, PRIORITY_BULK, PRIORITY_SINGLE
+)
+
+BENCH_DB = "course_extractor_bot_bench"
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+class Workload:
+    """Portal and single-link jobs sharing one blocking worker pool"""
+
+    def __init__(self, args):
+        self.args = args
+        self.pool = DownloadWorkerPool(max_workers=args.pool_workers)
+        self.finished: Dict[str, float] = {}
+
+    async def process_link(self, link: str) -> Dict:
+        await self.pool.run(time.sleep, self.args.unit_ms / 1000)
+        return {'title': link}
+
+    async def run_job(self, job: Dict):
+        payload = job['payload']
+        if job['kind'] == 'portal':
+            # Spread links over many hosts so per-host limits don't hide the contention
+            links = [f"https://host{i % 32}.bench.invalid/{payload['name']}/{i}" for i in range(self.args.links)]
+            await PortalBuilder(self.process_link).run(links)
+        else:
+            await self.process_link(payload['name'])
+        self.finished[payload['name']] = time.perf_counter()
+
+    def arrivals(self) -> List[Dict]:
+        """Portals arrive first, single links follow at a steady rate"""
+        jobs = []
+        for i in range(self.args.portals):
+            jobs.append({'at': 0.0, 'kind': 'portal', 'user_id': 1000 + i,
+                         'payload': {'name': f"portal-{i}"}, 'priority': PRIORITY_BULK})
+        for i in range(self.args.singles):
+            jobs.append({'at': 0.05 + i * self.args.interval_ms / 1000, 'kind': 'content',
+                         'user_id': i % self.args.users, 'payload': {'name': f"single-{i}"},
+                         'priority': PRIORITY_SINGLE})
+        return jobs
+
+    async def drive(self, submit) -> Dict[str, float]:
+        """Replay the arrivals through `submit` and return arrival times"""
+        self.finished = {}
+        arrived = {}
+        start = time.perf_counter()
+        for job in self.arrivals():
+            delay = start + job['at'] - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            arrived[job['payload']['name']] = time.perf_counter()
+            await submit(job)
+        while len(self.finished) < len(arrived):
+            await asyncio.sleep(0.05)
+        return arrived
+
+
+async def run_inline(workload: Workload) -> Dict[str, float]:
+    tasks = []
+
+    async def submit(job: Dict):
+        tasks.append(asyncio.ensure_future(workload.run_job(job)))
+
+    arrived = await workload.drive(submit)
+    await asyncio.gather(*tasks)
+    return arrived
+
+
+async def run_queued(workload: Workload, args) -> Dict[str, float]:
+    if args.uri:
+        from pymongo import MongoClient
+        collection = MongoClient(args.uri)[BENCH_DB].jobs
+        collection.drop()
+        store = MongoJobStore(collection)
+    else:
+        store = SQLiteJobStore(os.path.join(tempfile.mkdtemp(), "bench_jobs.db"))
+    scheduler = JobScheduler(store, {'portal': workload.run_job, 'content': workload.run_job},
+                             workers=args.job_workers)
+    await scheduler.start()
+
+    async def submit(job: Dict):
+        await scheduler.submit(job['kind'], job['user_id'], 0, 0, job['payload'], job['priority'])
+
+    try:
+        return await workload.drive(submit)
+    finally:
+        await scheduler.stop()
+
+
+def report(name: str, workload: Workload, arrived: Dict[str, float]):
+    singles = [(workload.finished[key] - at) * 1000 for key, at in arrived.items() if key.startswith('single')]
+    portals = [(workload.finished[key] - at) for key, at in arrived.items() if key.startswith('portal')]
+    print(f"{name:<8} singles p50 {statistics.median(singles):7.0f} ms  p95 {_percentile(singles, 0.95):7.0f} ms  "
+          f"p99 {_percentile(singles, 0.99):7.0f} ms  max {max(singles):7.0f} ms  |  "
+          f"slowest portal {max(portals):6.1f} s")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--portals', type=int, default=3, help="Concurrent portal requests")
+    parser.add_argument('--links', type=int, default=300, help="Links per portal")
+    parser.add_argument('--singles', type=int, default=60, help="Single-link requests")
+    parser.add_argument('--users', type=int, default=10, help="Distinct users sending single links")
+    parser.add_argument('--interval-ms', type=float, default=50, help="Gap between single-link arrivals")
+    parser.add_argument('--unit-ms', type=float, default=20, help="Blocking work per link")
+    parser.add_argument('--pool-workers', type=int, default=4, help="Threads in the shared download pool")
+    parser.add_argument('--job-workers', type=int, default=4, help="JobScheduler slots")
+    parser.add_argument('--uri', help="Use a MongoDB job store instead of a temporary SQLite file")
+    args = parser.parse_args()
+
+    print(f"{args.portals} portals x {args.links} links, {args.singles} single links every "
+          f"{args.interval_ms:.0f} ms, {args.unit_ms:.0f} ms per link on {args.pool_workers} pool workers\n")
+    workload = Workload(args)
+    report("inline", workload, await run_inline(workload))
+    report("queued", workload, await run_queued(workload, args))
+    workload.pool.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
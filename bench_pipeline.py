@@ -0,0 +1,88 @@
+"""
+Content pipeline tuning
+
+Pushes simulated items through the extract -> download -> DRM -> upload
+stages and reports throughput against handling one item at a time, plus the
+utilization of every stage. A stage near 100% is the bottleneck; give it more
+workers (PIPELINE_WORKERS) or give the idle ones fewer.
+
+Stage costs are in milliseconds. Extract, download and upload wait on the
+network; DRM holds a thread, like encryption holds a CPU.
+
+Usage: python bench_pipeline.py [--items 100] [--costs extract=20,download=120,drm=80,upload=90]
+                                [--workers extract=8,download=4,drm=2,upload=2]
+"""
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from utilities.pipeline import StagedPipeline
+from utilities.env_utils import parse_overrides
+
+STAGES = ['extract', 'download', 'drm', 'upload']
+DEFAULT_COSTS = {'extract': 20, 'download': 120, 'drm': 80, 'upload': 90}
+DEFAULT_WORKERS = {'extract': 8, 'download': 4, 'drm': 2, 'upload': 2}
+
+
+def make_stage(name: str, cost_ms: float, executor: ThreadPoolExecutor):
+    async def stage(item):
+        if name == 'drm':
+            await asyncio.get_running_loop().run_in_executor(executor, time.sleep, cost_ms / 1000)
+        else:
+            await asyncio.sleep(cost_ms / 1000)
+        return item
+    return stage
+
+
+async def sequential(args, costs) -> float:
+    executor = ThreadPoolExecutor(1)
+    stages = [make_stage(name, costs[name], executor) for name in STAGES]
+    start = time.perf_counter()
+    for item in range(args.items):
+        for stage in stages:
+            await stage(item)
+    executor.shutdown()
+    return time.perf_counter() - start
+
+
+async def pipelined(args, costs, workers) -> float:
+    executor = ThreadPoolExecutor(workers['drm'])
+    pipeline = StagedPipeline(
+        [(name, make_stage(name, costs[name], executor), workers[name]) for name in STAGES],
+        queue_size=args.queue_size, stats_interval=-1,
+    )
+    pipeline.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(pipeline.submit(item) for item in range(args.items)))
+    elapsed = time.perf_counter() - start
+    stats = pipeline.snapshot()
+    await pipeline.stop()
+    executor.shutdown()
+
+    for name, s in stats.items():
+        print(f"  {name:<9} {s['workers']:>2} workers  {s['utilization']:6.1%} busy")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--costs', help="Per-stage milliseconds, such as download=120,drm=80")
+    parser.add_argument('--workers', help="Per-stage worker counts, same format as PIPELINE_WORKERS")
+    parser.add_argument('--queue-size', type=int, default=16)
+    args = parser.parse_args()
+
+    costs = parse_overrides(args.costs, DEFAULT_COSTS)
+    workers = parse_overrides(args.workers, DEFAULT_WORKERS)
+
+    print(f"{args.items} items, stage costs {costs} ms")
+    baseline = asyncio.run(sequential(args, costs))
+    print(f"one at a time: {args.items / baseline:6.1f} items/s  ({baseline:.2f} s)")
+    print("pipelined:")
+    elapsed = asyncio.run(pipelined(args, costs, workers))
+    print(f"pipelined:     {args.items / elapsed:6.1f} items/s  ({elapsed:.2f} s)  {baseline / elapsed:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
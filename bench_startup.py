@@ -0,0 +1,131 @@
+"""
+Cold-start benchmark for main.py
+
+Starts a fresh interpreter per run and reports:
+- the import-time breakdown of `import main` (from python -X importtime),
+  grouped by top-level package, and which heavy dependencies were loaded
+- time to first handler: process start until /start has been answered,
+  with Telegram replaced by an in-process fake message
+
+With --uri, the runs also measure how long MongoDB and the authorization
+cache take to become ready. --budget-ms makes the script exit non-zero when
+the median time to first handler exceeds the budget, so regressions fail CI.
+
+Usage: python bench_startup.py [--runs 5] [--top 15] [--uri mongodb://localhost:27017] [--budget-ms 1500]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# Modules that should only load when a handler needs them
+HEAVY_MODULES = ['yt_dlp', 'jinja2', 'pymongo', 'cryptography', 'aiohttp']
+# Placeholder credentials; the Telegram client is never started
+DUMMY_ENV = {'API_ID': '1', 'API_HASH': 'bench', 'BOT_TOKEN': '1:bench'}
+
+_PROBE = r'''
+import sys, json, time, asyncio
+t0 = float(sys.argv[1])
+import main
+imported = time.time()
+
+class FakeMessage:
+    async def reply_text(self, *args, **kwargs):
+        pass
+
+async def first_handler():
+    await main.start(main.app, FakeMessage())
+    handled = time.time()
+    ready = None
+    if len(sys.argv) > 2:
+        import os
+        os.environ["MONGODB_URI"] = sys.argv[2]
+        main.services_ready = asyncio.Event()
+        await main.start_services()
+        ready = time.time()
+        await main.stop_services()
+    return handled, ready
+
+handled, ready = asyncio.get_event_loop().run_until_complete(first_handler())
+print(json.dumps({
+    "import": imported - t0,
+    "first_handler": handled - t0,
+    "services": None if ready is None else ready - handled,
+    "heavy": [name for name in HEAVY if name in sys.modules],
+}))
+'''
+
+
+def _env() -> Dict[str, str]:
+    env = dict(DUMMY_ENV)
+    env.update(os.environ)
+    return env
+
+
+def import_breakdown() -> List[Tuple[str, float]]:
+    """Import time in ms per top-level package for `import main`"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=HERE, env=_env(), capture_output=True, text=True, check=True
+    )
+    totals: Dict[str, float] = defaultdict(float)
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        if not self_us.strip().isdigit():
+            continue  # header line
+        # Sum self time so nested imports are attributed to their own package
+        totals[name.strip().split('.')[0]] += int(self_us) / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def probe(uri: str = None) -> Dict:
+    """Run one cold start in a fresh interpreter"""
+    script = f"HEAVY = {HEAVY_MODULES!r}\n" + _PROBE
+    args = [sys.executable, '-c', script, repr(time.time())]
+    if uri:
+        args.append(uri)
+    result = subprocess.run(args, cwd=HERE, env=_env(), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Startup probe failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="Packages shown in the import breakdown")
+    parser.add_argument('--uri', help="MongoDB URI to also time service startup against")
+    parser.add_argument('--budget-ms', type=float, help="Fail when median time to first handler exceeds this")
+    args = parser.parse_args()
+
+    print("Import time of main.py by top-level package (ms):")
+    for name, ms in import_breakdown()[:args.top]:
+        print(f"  {name:<24} {ms:8.1f}")
+
+    runs = [probe(args.uri) for _ in range(args.runs)]
+    imports = [run['import'] * 1000 for run in runs]
+    handlers = [run['first_handler'] * 1000 for run in runs]
+    print(f"\n{args.runs} cold starts (ms): import main median {statistics.median(imports):.0f}, "
+          f"first handler median {statistics.median(handlers):.0f} (min {min(handlers):.0f}, max {max(handlers):.0f})")
+    if args.uri:
+        services = [run['services'] * 1000 for run in runs]
+        print(f"MongoDB + authorization cache ready after first handler: median {statistics.median(services):.0f} ms")
+
+    heavy = sorted({name for run in runs for name in run['heavy']})
+    print(f"Heavy modules loaded before the first handler: {', '.join(heavy) or 'none'}")
+
+    if args.budget_ms and statistics.median(handlers) > args.budget_ms:
+        print(f"FAIL: time to first handler exceeds {args.budget_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Multi-process job worker check
+
+Starts several worker processes that share one job store, submits a batch of
+jobs, and reports throughput for each process count. With --kill, one
+worker is killed (SIGKILL) mid-run; its jobs must be taken over once their
+leases lapse. At the end every job must be done and completed exactly once.
+
+Runs against a local mongod with --uri, or a temporary SQLite file.
+
+Usage: python bench_workers.py [--uri mongodb://localhost:27017] [--processes 1,2,4] [--jobs 200] [--kill]
+"""
+import os
+import sys
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+from typing import List
+
+from utilities.job_queue import JobScheduler, MongoJobStore, SQLiteJobStore
+
+BENCH_DB = "course_extractor_bot_bench"
+
+
+def _store(spec: str):
+    if spec.startswith("mongodb"):
+        from pymongo import MongoClient
+        return MongoJobStore(MongoClient(spec)[BENCH_DB].jobs)
+    return SQLiteJobStore(spec)
+
+
+def _finished(store) -> int:
+    if isinstance(store, MongoJobStore):
+        return store.collection.count_documents({'status': {'$in': ['done', 'failed']}})
+    return store._execute("SELECT COUNT(*) FROM jobs WHERE status IN ('done', 'failed')")[0][0]
+
+
+def _statuses(store) -> Counter:
+    if isinstance(store, MongoJobStore):
+        return Counter(job['status'] for job in store.collection.find({}, {'status': 1}))
+    return Counter(status for status, in store._execute("SELECT status FROM jobs"))
+
+
+async def serve(args):
+    """Worker process: run jobs until killed, logging each completion"""
+    async def work(job):
+        await asyncio.sleep(args.unit_ms / 1000)
+        # Single small appends are atomic, so workers can share the log
+        with open(args.log, 'a') as f:
+            f.write(f"{job['_id']}\n")
+
+    scheduler = JobScheduler(_store(args.serve), {'bench': work}, workers=args.slots,
+                             poll_interval=0.2, lease_seconds=args.lease)
+    await scheduler.start()
+    while True:
+        await asyncio.sleep(3600)
+
+
+def run(args, spec: str, processes: int) -> float:
+    store = _store(spec)
+    store.ensure_indexes()
+    if isinstance(store, MongoJobStore):
+        store.collection.delete_many({})
+    log = os.path.join(tempfile.mkdtemp(), "completions.log")
+
+    # Queue everything up front so each run measures steady-state throughput
+    submitter = JobScheduler(store, {}, workers=0)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(submitter.start())
+    for i in range(args.jobs):
+        loop.run_until_complete(submitter.submit('bench', i % 20, 0, 0, {'n': i}))
+    loop.close()
+
+    workers: List[subprocess.Popen] = [
+        subprocess.Popen([sys.executable, __file__, '--serve', spec, '--log', log,
+                          '--unit-ms', str(args.unit_ms), '--slots', str(args.slots), '--lease', str(args.lease)])
+        for _ in range(processes)
+    ]
+    start = time.perf_counter()
+    killed = False
+    try:
+        while _finished(store) < args.jobs:
+            if args.kill and not killed and processes > 1 and time.perf_counter() - start > 1:
+                workers[0].send_signal(signal.SIGKILL)
+                killed = True
+                print(f"  killed worker pid {workers[0].pid}")
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - start
+    finally:
+        for worker in workers:
+            worker.kill()
+            worker.wait()
+
+    with open(log) as f:
+        completions = Counter(line.strip() for line in f if line.strip())
+    duplicates = sum(1 for count in completions.values() if count > 1)
+    statuses = _statuses(store)
+    print(f"{processes} process(es): {args.jobs / elapsed:7.1f} jobs/s  ({elapsed:.1f} s)  "
+          f"statuses {dict(statuses)}  completed twice: {duplicates}")
+    if duplicates or statuses.get('done', 0) != args.jobs:
+        raise Exception("Some jobs were lost or completed more than once")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', help="MongoDB URI; a temporary SQLite file is used otherwise")
+    parser.add_argument('--processes', default="1,2,4", help="Comma-separated worker process counts")
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--unit-ms', type=float, default=50, help="Work per job")
+    parser.add_argument('--slots', type=int, default=4, help="Jobs each process runs at once")
+    parser.add_argument('--lease', type=float, default=3, help="Lease length in seconds")
+    parser.add_argument('--kill', action='store_true', help="SIGKILL one worker mid-run")
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    parser.add_argument('--log', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        asyncio.run(serve(args))
+        return
+
+    for processes in (int(n) for n in args.processes.split(',')):
+        spec = args.uri or os.path.join(tempfile.mkdtemp(), "bench_jobs.db")
+        run(args, spec, processes)
+
+
+if __name__ == '__main__':
+    main()
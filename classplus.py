@@ -1,6 +1,6 @@
 import re
 import aiohttp
-from typing import Dict, List
+from typing import Dict, List, Optional
 from extractors.base_extractor import BaseExtractor
 
 class ClassPlusExtractor(BaseExtractor):
@@ -9,24 +9,24 @@ class ClassPlusExtractor(BaseExtractor):
     def is_valid_url(self, url: str) -> bool:
         return bool(re.match(r'https?://(www\.)?classplus\.app/.+', url))
     
-    async def extract(self, url: str) -> Dict:
+    async def extract_content(self, url: str) -> Dict:
         """Extract content from ClassPlus without login"""
         # ClassPlus uses a different approach - we need to find the embedded iframe first
-        async with aiohttp.ClientSession() as session:
-            # Step 1: Get the page content to find iframe
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to fetch ClassPlus page: HTTP {response.status}")
-                
-                html = await response.text()
-                
-                # Step 2: Extract iframe src
-                iframe_src = self._extract_iframe_src(html)
-                if not iframe_src:
-                    raise Exception("Could not find content iframe in ClassPlus page")
-                
-                # Step 3: Get content from iframe
-                return await self._get_iframe_content(session, iframe_src)
+        session = await self.get_session()
+        # Step 1: Get the page content to find iframe
+        async with session.get(url) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to fetch ClassPlus page: HTTP {response.status}")
+            
+            html = await response.text()
+            
+            # Step 2: Extract iframe src
+            iframe_src = self._extract_iframe_src(html)
+            if not iframe_src:
+                raise Exception("Could not find content iframe in ClassPlus page")
+            
+            # Step 3: Get content from iframe
+            return await self._get_iframe_content(session, iframe_src)
     
     def _extract_iframe_src(self, html: str) -> Optional[str]:
         """Extract iframe src from HTML"""
@@ -1,14 +1,127 @@
-from datetime import datetime  # यह लाइन जरूर जोड़ें
-from pymongo import MongoClient
-from config import Config
-
-class Database:
-    def __init__(self):
-        self.client = MongoClient(Config.MONGO_URI)
-        self.db = self.client.course_extractor_bot
-    
-    def add_user(self, user_id, username, first_name, last_name):
-        users = self.db.users
+from datetime import datetime, timedelta  # यह लाइन जरूर जोड़ें
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from typing import Dict, List, Optional
+from pymongo import ASCENDING, DESCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 5.0
+# Upper bound on buffered log entries kept while MongoDB is unreachable
+MAX_BUFFERED_LOGS = 10000
+DAY_FORMAT = "%Y-%m-%d"
+DUPLICATE_KEY = 11000
+
+
+class MongoDB:
+    """
+    Async data-access layer over pymongo
+
+    Every round-trip runs on a small dedicated thread pool so handlers never
+    block the event loop. Activity logs are buffered in memory and written
+    with insert_many when the buffer fills up, on a timer, and on close().
+
+    Each flush also bumps per user / platform / day counters in the
+    request_stats collection, so statistics never scan the raw request log.
+    With REQUEST_LOG_RETENTION_DAYS set, raw entries older than that are
+    expired by MongoDB while the rollups are kept.
+    """
+
+    def __init__(self, uri: Optional[str] = None, db_name: str = "course_extractor_bot",
+                 flush_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.client = MongoClient(uri or os.getenv("MONGODB_URI"), connect=False)
+        self.db = self.client[db_name]
+        self.flush_size = flush_size or int(os.getenv("MONGO_LOG_FLUSH_SIZE", DEFAULT_FLUSH_SIZE))
+        self.flush_interval = flush_interval or float(os.getenv("MONGO_LOG_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL))
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("MONGO_THREADS", 4)), thread_name_prefix="mongo"
+        )
+        self._log_buffer: List[Dict] = []
+        # Rollup increments not yet applied, keyed by (user_id, platform, day)
+        self._stats_backlog: Counter = Counter()
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._pending_flushes = set()
+        retention = os.getenv("REQUEST_LOG_RETENTION_DAYS")
+        self.log_retention_days = int(retention) if retention else None
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(*args, **kwargs))
+
+    async def start(self):
+        """Connect, prepare indexes and start the periodic log flusher"""
+        await self._run(self.client.admin.command, 'ping')
+        await self._run(self.ensure_indexes)
+        if await self._run(self.db.request_stats.estimated_document_count) == 0:
+            if await self._run(self.db.requests.estimated_document_count) > 0:
+                logger.info("Building request statistics from the existing request log")
+                await self._run(self.rebuild_rollups)
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._flush_periodically())
+
+    async def close(self):
+        """Flush buffered logs and release the connection"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        await self._run(self.client.close)
+        self._executor.shutdown(wait=False)
+
+    def ensure_indexes(self):
+        """Create the indexes the queries below rely on (blocking, idempotent)"""
+        self.db.users.create_index([('user_id', ASCENDING)], unique=True)
+        self.db.users.create_index([('authorized', ASCENDING)])
+        self.db.requests.create_index([('user_id', ASCENDING), ('requested_at', DESCENDING)])
+        self.db.request_stats.create_index(
+            [('user_id', ASCENDING), ('platform', ASCENDING), ('day', ASCENDING)], unique=True
+        )
+        self.db.request_stats.create_index([('day', ASCENDING)])
+
+        if self.log_retention_days:
+            # Raw entries expire; request_stats keeps their aggregates
+            ttl = self.log_retention_days * 86400
+            if self._has_retention_index():
+                self.db.command('collMod', 'requests',
+                                index={'keyPattern': {'requested_at': 1}, 'expireAfterSeconds': ttl})
+            else:
+                self.db.requests.create_index([('requested_at', ASCENDING)], expireAfterSeconds=ttl)
+
+    def _has_retention_index(self) -> bool:
+        return any(
+            index.get('key') == {'requested_at': 1}
+            for index in self.db.requests.list_indexes()
+        )
+
+    def rebuild_rollups(self):
+        """Recompute request_stats from the raw request log (blocking)"""
+        self.db.request_stats.delete_many({})
+        self.db.requests.aggregate([
+            {'$group': {
+                '_id': {
+                    'user_id': '$user_id',
+                    'platform': '$platform',
+                    'day': {'$dateToString': {'format': DAY_FORMAT, 'date': '$requested_at'}},
+                },
+                'count': {'$sum': 1},
+            }},
+            {'$project': {
+                '_id': 0,
+                'user_id': '$_id.user_id',
+                'platform': '$_id.platform',
+                'day': '$_id.day',
+                'count': 1,
+            }},
+            {'$merge': {'into': 'request_stats', 'on': ['user_id', 'platform', 'day']}},
+        ])
+
+    async def add_user(self, user_id, username, first_name, last_name):
         user_data = {
             'user_id': user_id,
             'username': username,
@@ -16,18 +129,137 @@ class Database:
             'last_name': last_name,
             'joined_at': datetime.now()
         }
-        users.update_one({'user_id': user_id}, {'$set': user_data}, upsert=True)
-    
-    def log_request(self, user_id, platform, course_name):
-        requests = self.db.requests
-        request_data = {
+        await self._run(self.db.users.update_one, {'user_id': user_id}, {'$set': user_data}, upsert=True)
+
+    async def is_user_authorized(self, user_id) -> bool:
+        user = await self._run(self.db.users.find_one, {'user_id': user_id, 'authorized': True}, {'_id': 1})
+        return user is not None
+
+    async def get_authorized_user_ids(self) -> List[int]:
+        users = await self._run(
+            lambda: list(self.db.users.find({'authorized': True}, {'user_id': 1, '_id': 0}))
+        )
+        return [user['user_id'] for user in users]
+
+    async def set_user_authorized(self, user_id, authorized: bool):
+        await self._run(
+            self.db.users.update_one,
+            {'user_id': user_id}, {'$set': {'user_id': user_id, 'authorized': authorized}}, upsert=True
+        )
+
+    async def log_request(self, user_id, platform, course_name):
+        """Queue an activity log entry; it is written in the next batch"""
+        self._log_buffer.append({
             'user_id': user_id,
             'platform': platform,
             'course_name': course_name,
             'requested_at': datetime.now()
-        }
-        requests.insert_one(request_data)
-    
-    def get_user_stats(self, user_id):
-        requests = self.db.requests
-        return requests.count_documents({'user_id': user_id})
+        })
+        if len(self._log_buffer) >= self.flush_size:
+            task = asyncio.ensure_future(self.flush())
+            self._pending_flushes.add(task)
+            task.add_done_callback(self._pending_flushes.discard)
+
+    async def flush(self):
+        """
+        Write all buffered log entries with a single insert_many
+
+        Only entries that failed are kept for the next flush. insert_many
+        gives every entry an _id, so one that was written by an attempt that
+        still reported an error comes back as a duplicate key and counts as
+        written. Rollup increments that fail are carried over the same way.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._log_buffer and not self._stats_backlog:
+                return
+            batch, self._log_buffer = self._log_buffer, []
+            written, failed = batch, []
+            if batch:
+                try:
+                    await self._run(self.db.requests.insert_many, batch, ordered=False)
+                except BulkWriteError as e:
+                    failed_indexes = {
+                        error['index'] for error in e.details.get('writeErrors', [])
+                        if error.get('code') != DUPLICATE_KEY
+                    }
+                    written = [entry for index, entry in enumerate(batch) if index not in failed_indexes]
+                    failed = [entry for index, entry in enumerate(batch) if index in failed_indexes]
+                    logger.error(f"Failed to write {len(failed)} of {len(batch)} activity logs: {str(e)}")
+                except Exception as e:
+                    logger.error(f"Failed to write {len(batch)} activity logs: {str(e)}")
+                    written, failed = [], batch
+            if failed:
+                # Put them back for the next attempt, dropping the oldest on overflow
+                self._log_buffer = (failed + self._log_buffer)[-MAX_BUFFERED_LOGS:]
+
+            counts, self._stats_backlog = self._stats_backlog, Counter()
+            counts.update(
+                (entry['user_id'], entry['platform'], entry['requested_at'].strftime(DAY_FORMAT))
+                for entry in written
+            )
+            if not counts:
+                return
+            keys = list(counts)
+            updates = [
+                UpdateOne(
+                    {'user_id': user_id, 'platform': platform, 'day': day},
+                    {'$inc': {'count': counts[(user_id, platform, day)]}},
+                    upsert=True
+                )
+                for user_id, platform, day in keys
+            ]
+            try:
+                await self._run(self.db.request_stats.bulk_write, updates, ordered=False)
+            except BulkWriteError as e:
+                logger.error(f"Failed to update request statistics: {str(e)}")
+                for error in e.details.get('writeErrors', []):
+                    key = keys[error['index']]
+                    self._stats_backlog[key] += counts[key]
+            except Exception as e:
+                # Whether any increment landed is unknown; retrying all keeps counts from going missing
+                logger.error(f"Failed to update request statistics: {str(e)}")
+                self._stats_backlog.update(counts)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Periodic log flush failed: {str(e)}")
+
+    async def get_user_stats(self, user_id) -> int:
+        totals = await self._run(lambda: list(self.db.request_stats.aggregate([
+            {'$match': {'user_id': user_id}},
+            {'$group': {'_id': None, 'count': {'$sum': '$count'}}},
+        ])))
+        stored = totals[0]['count'] if totals else 0
+        pending = sum(1 for entry in self._log_buffer if entry['user_id'] == user_id)
+        return stored + pending
+
+    async def get_activity_summary(self, days: int = 7) -> Dict:
+        """Requests per platform and per day over the last `days` days, from rollups"""
+        since = (datetime.now() - timedelta(days=days - 1)).strftime(DAY_FORMAT)
+
+        def summarize():
+            match = {'$match': {'day': {'$gte': since}}}
+            by_platform = self.db.request_stats.aggregate([
+                match, {'$group': {'_id': '$platform', 'count': {'$sum': '$count'}}},
+                {'$sort': {'count': -1}},
+            ])
+            by_day = self.db.request_stats.aggregate([
+                match, {'$group': {'_id': '$day', 'count': {'$sum': '$count'}}},
+                {'$sort': {'_id': 1}},
+            ])
+            return {
+                'platforms': {doc['_id']: doc['count'] for doc in by_platform},
+                'days': {doc['_id']: doc['count'] for doc in by_day},
+            }
+
+        return await self._run(summarize)
+
+
+# Backwards-compatible name for the old blocking class
+Database = MongoDB
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import asyncio
+import hashlib
+import logging
+import aiohttp
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Optional
+from utilities.http_client import get_http_client
+from utilities.worker_pool import get_crypto_pool
+from utilities.url_utils import normalize_url
+from utilities.scratch import ScratchFlight, link_into, scratch_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = ".download_cache"
+DEFAULT_CACHE_MB = 2048
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file, run in the crypto pool for large downloads"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _link_or_copy(src: str, dst: str):
+    """Hard link src to dst, copying when the filesystem can't link"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class DownloadCache:
+    """
+    On-disk cache of downloaded files
+
+    Entries are keyed by normalized URL plus the origin's validators
+    (ETag / Last-Modified / Content-Length) and stored once per content hash
+    under objects/. Files are published with an atomic rename, so readers
+    never see a partial object, and the least recently used entries are
+    evicted once the cache grows past its disk budget. Concurrent fetches of
+    the same URL share one download.
+
+    Every worker process on the host may use the same cache directory, so
+    index.json is re-read under a file lock for each lookup and publish and
+    never trusted from memory; entries whose object another process evicted
+    are dropped as misses.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or os.getenv("DOWNLOAD_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes or int(os.getenv("DOWNLOAD_CACHE_MB", DEFAULT_CACHE_MB)) * 1024 * 1024
+        self.objects_dir = os.path.join(self.cache_dir, "objects")
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.lock_path = os.path.join(self.cache_dir, "index.lock")
+        self._lock = asyncio.Lock()
+        self._inflight = ScratchFlight("download")
+
+    def _load_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        # Drop entries whose object disappeared
+        return {
+            key: entry for key, entry in index.items()
+            if os.path.exists(self._object_path(entry['hash']))
+        }
+
+    def _save_index(self, index: Dict[str, Dict]):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    @contextmanager
+    def _locked_index(self) -> Iterator[Dict[str, Dict]]:
+        """The index as on disk, saved back on success; other processes wait meanwhile (blocking)"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = self._load_index()
+            yield index
+            self._save_index(index)
+
+    def _object_path(self, content_hash: str) -> str:
+        return os.path.join(self.objects_dir, content_hash)
+
+    async def probe(self, url: str) -> Dict[str, Optional[str]]:
+        """Fetch the origin's validators for url with a HEAD request"""
+        session = await get_http_client().get_session()
+        try:
+            async with session.head(url, allow_redirects=True) as response:
+                if response.status != 200:
+                    return {}
+                return {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'content_length': response.headers.get('Content-Length'),
+                }
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"Cache probe failed for {url}: {str(e)}")
+            return {}
+
+    def cache_key(self, url: str, validators: Dict[str, Optional[str]]) -> Optional[str]:
+        """Cache key for url, or None when the origin gives nothing to validate against"""
+        if not any(validators.values()):
+            return None
+        material = "\n".join([
+            normalize_url(url),
+            validators.get('etag') or '',
+            validators.get('last_modified') or '',
+            validators.get('content_length') or '',
+        ])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    async def lookup(self, key: str) -> Optional[str]:
+        """Materialize a cached entry into the current scratch directory and return its path"""
+        dest_dir = scratch_path('')
+        async with self._lock:
+            return await asyncio.get_running_loop().run_in_executor(None, self._lookup, key, dest_dir)
+
+    def _lookup(self, key: str, dest_dir: str) -> Optional[str]:
+        with self._locked_index() as index:
+            entry = index.get(key)
+            if not entry:
+                return None
+            dest = os.path.join(dest_dir, entry['file_name'])
+            if os.path.exists(dest):
+                os.remove(dest)
+            try:
+                _link_or_copy(self._object_path(entry['hash']), dest)
+            except FileNotFoundError:
+                # Evicted by a process that doesn't take the lock
+                del index[key]
+                return None
+            entry['last_access'] = time.time()
+            return dest
+
+    async def publish(self, key: str, url: str, file_path: str):
+        """Add a completed download to the cache"""
+        content_hash = await get_crypto_pool().run(hash_file, file_path)
+        async with self._lock:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._publish, key, url, file_path, content_hash
+            )
+
+    def _publish(self, key: str, url: str, file_path: str, content_hash: str):
+        object_path = self._object_path(content_hash)
+        with self._locked_index() as index:
+            if not os.path.exists(object_path):
+                # Stage next to the object and rename so readers never see partial data
+                tmp_path = f"{object_path}.{os.getpid()}.tmp"
+                _link_or_copy(file_path, tmp_path)
+                os.replace(tmp_path, object_path)
+            index[key] = {
+                'hash': content_hash,
+                'url': normalize_url(url),
+                'file_name': os.path.basename(file_path),
+                'size': os.path.getsize(object_path),
+                'last_access': time.time(),
+            }
+            self._evict(index)
+
+    def _evict(self, index: Dict[str, Dict]):
+        """Remove least recently used entries until the cache fits its budget"""
+        sizes = {entry['hash']: entry['size'] for entry in index.values()}
+        total = sum(sizes.values())
+        for key, entry in sorted(index.items(), key=lambda item: item[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            del index[key]
+            # Objects are shared by content hash; delete only when unreferenced
+            if not any(other['hash'] == entry['hash'] for other in index.values()):
+                total -= sizes[entry['hash']]
+                try:
+                    os.remove(self._object_path(entry['hash']))
+                except FileNotFoundError:
+                    pass
+                logger.info(f"Evicted {entry['url']} from download cache")
+
+    async def fetch(self, url: str, download: Callable[[], Awaitable[str]]) -> str:
+        """
+        Return a copy of url in the current scratch directory, calling
+        `download` only on a cache miss; it runs in the download's own
+        scratch directory, so reserve disk space inside it
+        """
+        return await self._inflight.do(normalize_url(url), lambda: self._fetch(url, download), link_into)
+
+    async def _fetch(self, url: str, download: Callable[[], Awaitable[str]]) -> str:
+        validators = await self.probe(url)
+        key = self.cache_key(url, validators)
+        if key:
+            cached = await self.lookup(key)
+            if cached:
+                logger.info(f"Download cache hit for {url}")
+                return cached
+
+        file_path = await download()
+        if key:
+            try:
+                await self.publish(key, url, file_path)
+            except Exception as e:
+                logger.warning(f"Could not cache {url}: {str(e)}")
+        return file_path
+
+
+_download_cache: Optional[DownloadCache] = None
+
+
+def get_download_cache() -> DownloadCache:
+    """Get the application-wide download cache"""
+    global _download_cache
+    if _download_cache is None:
+        _download_cache = DownloadCache()
+    return _download_cache
@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import asyncio
+import hashlib
+import logging
+import aiohttp
+from typing import Callable, Dict, List, Optional, Tuple
+from utilities.url_utils import normalize_url
+from utilities.download_cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEGMENTS = 4
+MIN_SEGMENT_SIZE = 4 * 1024 * 1024
+MIN_BUFFER_SIZE = 256 * 1024
+MAX_BUFFER_SIZE = 8 * 1024 * 1024
+# Aim to flush the write buffer roughly this often at the observed speed
+BUFFER_TARGET_SECONDS = 0.25
+STATE_SAVE_INTERVAL = 2.0
+SEGMENT_RETRIES = 3
+# Unfinished downloads untouched for this long are deleted
+DEFAULT_PARTIAL_HOURS = 24
+
+
+class RangeNotSupported(Exception):
+    """Server ignored a Range request"""
+
+
+class _AdaptiveBuffer:
+    """Grows or shrinks the write batch size to match the observed throughput"""
+
+    def __init__(self):
+        self.size = MIN_BUFFER_SIZE
+        self._started = time.monotonic()
+
+    def flushed(self, nbytes: int):
+        elapsed = max(time.monotonic() - self._started, 1e-6)
+        target = int(nbytes / elapsed * BUFFER_TARGET_SECONDS)
+        self.size = max(MIN_BUFFER_SIZE, min(MAX_BUFFER_SIZE, target))
+        self._started = time.monotonic()
+
+
+class SegmentedDownloader:
+    """
+    Downloads a URL as N concurrent byte ranges into a preallocated file
+
+    Ranged downloads of files the server identifies by ETag or Last-Modified
+    are kept under `<DOWNLOAD_CACHE_DIR>/partial`, keyed by URL and
+    validators, with progress in a `.state` sidecar. A transfer that is
+    interrupted, even by the job that started it going away, resumes from the
+    bytes already on disk as long as the server still reports the same size
+    and validators. Partials left untouched for DOWNLOAD_PARTIAL_HOURS are
+    deleted. Servers that do not support ranges are fetched as a single
+    stream.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, segments: Optional[int] = None,
+                 progress: Optional[Callable[[int, int], None]] = None, partial_dir: Optional[str] = None):
+        self.session = session
+        self.segments = segments or int(os.getenv("DOWNLOAD_SEGMENTS", DEFAULT_SEGMENTS))
+        self.progress = progress
+        self.partial_dir = partial_dir or os.path.join(os.getenv("DOWNLOAD_CACHE_DIR", DEFAULT_CACHE_DIR), "partial")
+
+    async def download(self, url: str, file_path: str) -> str:
+        """Download url to file_path and return file_path"""
+        probe = await self._probe(url)
+        size = probe.get('size')
+        if not (probe.get('ranges') and size and size >= MIN_SEGMENT_SIZE and self.segments > 1):
+            await self._download_single(url, f"{file_path}.part")
+            os.replace(f"{file_path}.part", file_path)
+            return file_path
+
+        base, lock = self._claim_partial(url, probe)
+        part_path = f"{base or file_path}.part"
+        state_path = f"{base or file_path}.state"
+        try:
+            try:
+                await self._download_ranges(url, part_path, state_path, probe)
+            except RangeNotSupported:
+                logger.info(f"Range requests ignored by server, falling back to single stream: {url}")
+                await self._download_single(url, part_path)
+            # The partial directory may be on another filesystem than the scratch directory
+            await asyncio.get_running_loop().run_in_executor(None, shutil.move, part_path, file_path)
+            if os.path.exists(state_path):
+                os.remove(state_path)
+        finally:
+            if lock is not None:
+                os.close(lock)
+        return file_path
+
+    def _claim_partial(self, url: str, probe: Dict) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Path prefix for the resumable partial download of url and the locked
+        descriptor guarding it; (None, None) when the server gives no
+        validators or another process is downloading the same file
+        """
+        if not (probe.get('etag') or probe.get('last_modified')):
+            return None, None
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self._expire_partials()
+        material = "\n".join([normalize_url(url), probe.get('etag') or '', probe.get('last_modified') or '',
+                              str(probe['size'])])
+        base = os.path.join(self.partial_dir, hashlib.sha256(material.encode()).hexdigest())
+        lock = os.open(f"{base}.lock", os.O_CREAT | os.O_RDWR)
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(lock)
+            return None, None
+        return base, lock
+
+    def _expire_partials(self):
+        cutoff = time.time() - float(os.getenv("DOWNLOAD_PARTIAL_HOURS", DEFAULT_PARTIAL_HOURS)) * 3600
+        for name in os.listdir(self.partial_dir):
+            path = os.path.join(self.partial_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    logger.info(f"Removed expired partial download {name}")
+            except OSError:
+                pass
+
+    async def _probe(self, url: str) -> Dict:
+        """Find out size, range support and validators for url"""
+        try:
+            async with self.session.head(url, allow_redirects=True) as response:
+                if response.status == 200:
+                    length = response.headers.get('Content-Length')
+                    return {
+                        'size': int(length) if length and length.isdigit() else None,
+                        'ranges': response.headers.get('Accept-Ranges', '').lower() == 'bytes',
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified'),
+                    }
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"HEAD probe failed for {url}: {str(e)}")
+        return {'size': None, 'ranges': False}
+
+    def _load_state(self, state_path: str, part_path: str, probe: Dict) -> Optional[Dict]:
+        if not (os.path.exists(state_path) and os.path.exists(part_path)):
+            return None
+        try:
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Only resume if the remote file is provably the same one
+        if (state.get('size') != probe['size']
+                or state.get('etag') != probe.get('etag')
+                or state.get('last_modified') != probe.get('last_modified')):
+            return None
+        return state
+
+    def _save_state(self, state_path: str, state: Dict):
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    def _plan_segments(self, size: int) -> List[List[int]]:
+        count = max(1, min(self.segments, size // MIN_SEGMENT_SIZE))
+        step = -(-size // count)
+        # Each segment is [start, end_inclusive, bytes_done]
+        return [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+
+    async def _download_ranges(self, url: str, part_path: str, state_path: str, probe: Dict):
+        size = probe['size']
+        state = self._load_state(state_path, part_path, probe)
+        if state:
+            logger.info(f"Resuming download of {url}")
+        else:
+            state = {
+                'url': url,
+                'size': size,
+                'etag': probe.get('etag'),
+                'last_modified': probe.get('last_modified'),
+                'segments': self._plan_segments(size),
+            }
+            with open(part_path, 'wb') as f:
+                f.truncate(size)
+            self._save_state(state_path, state)
+
+        last_save = time.monotonic()
+
+        def checkpoint(force: bool = False):
+            nonlocal last_save
+            now = time.monotonic()
+            if force or now - last_save >= STATE_SAVE_INTERVAL:
+                last_save = now
+                self._save_state(state_path, state)
+            if self.progress:
+                self.progress(sum(seg[2] for seg in state['segments']), size)
+
+        tasks = [
+            asyncio.ensure_future(self._fetch_segment(url, part_path, segment, checkpoint))
+            for segment in state['segments']
+            if segment[0] + segment[2] <= segment[1]
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Stop the other segments before the state is saved for a later resume
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            checkpoint(force=True)
+
+    async def _fetch_segment(self, url: str, part_path: str, segment: List[int], checkpoint: Callable):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        with open(part_path, 'r+b') as f:
+            while segment[0] + segment[2] <= segment[1]:
+                offset = segment[0] + segment[2]
+                headers = {'Range': f"bytes={offset}-{segment[1]}"}
+                try:
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status == 200:
+                            raise RangeNotSupported()
+                        if response.status != 206:
+                            raise Exception(f"Failed to download file (HTTP {response.status})")
+
+                        buffer = _AdaptiveBuffer()
+                        pending = bytearray()
+                        async for chunk in response.content.iter_any():
+                            pending += chunk
+                            if len(pending) >= buffer.size:
+                                await loop.run_in_executor(None, _write_at, f, offset, bytes(pending))
+                                offset += len(pending)
+                                segment[2] += len(pending)
+                                buffer.flushed(len(pending))
+                                pending.clear()
+                                checkpoint()
+                        if pending:
+                            await loop.run_in_executor(None, _write_at, f, offset, bytes(pending))
+                            segment[2] += len(pending)
+                            checkpoint()
+                    if segment[0] + segment[2] <= segment[1]:
+                        raise aiohttp.ClientPayloadError("Range response ended early")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    attempt += 1
+                    if attempt > SEGMENT_RETRIES:
+                        raise
+                    logger.warning(f"Segment {segment[0]}-{segment[1]} interrupted ({str(e)}), retrying")
+                    await asyncio.sleep(attempt)
+
+    async def _download_single(self, url: str, part_path: str):
+        loop = asyncio.get_running_loop()
+        async with self.session.get(url) as response:
+            if response.status != 200:
+                raise Exception(f"Failed to download file (HTTP {response.status})")
+
+            total = response.content_length or 0
+            done = 0
+            buffer = _AdaptiveBuffer()
+            pending = bytearray()
+            with open(part_path, 'wb') as f:
+                async for chunk in response.content.iter_any():
+                    pending += chunk
+                    if len(pending) >= buffer.size:
+                        await loop.run_in_executor(None, f.write, bytes(pending))
+                        done += len(pending)
+                        buffer.flushed(len(pending))
+                        pending.clear()
+                        if self.progress:
+                            self.progress(done, total)
+                if pending:
+                    await loop.run_in_executor(None, f.write, bytes(pending))
+                    done += len(pending)
+                    if self.progress:
+                        self.progress(done, total)
+
+
+def _write_at(f, offset: int, data: bytes):
+    f.seek(offset)
+    f.write(data)
@@ -1,11 +1,374 @@
 import os
+import base64
+import struct
+import asyncio
+import hashlib
 import subprocess
-from cryptography.fernet import Fernet
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import logging
-from typing import Dict
+from typing import Callable, Dict, Iterator, Optional, BinaryIO
 
 logger = logging.getLogger(__name__)
 
+# Chunked container layout:
+#   header  = magic(4) | version(1) | segment_size(4) | nonce_prefix(7)
+#   segment = AES-256-GCM(plaintext[segment_size]) | tag(16)
+# Every segment uses nonce = nonce_prefix | index(4) | final(1) and the header
+# as associated data, so segments cannot be reordered, truncated or moved
+# between files. All segments except the last hold exactly segment_size bytes,
+# which makes the offset of any segment computable for random access.
+MAGIC = b"DRMC"
+FORMAT_VERSION = 1
+HEADER_FORMAT = "!4sBI7s"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+DEFAULT_SEGMENT_SIZE = 1024 * 1024
+MAX_SEGMENT_INDEX = 2 ** 32 - 1
+
+# Streaming mode (DRM_STREAMING=1) encrypts direct video downloads as they
+# arrive instead of downloading to a plaintext file first
+DEFAULT_STREAM_BUFFER = 4
+STREAM_RETRIES = 3
+# Responses that yt-dlp has to handle (playlists, manifests, web pages)
+UNSTREAMABLE_TYPES = ('mpegurl', 'dash+xml', 'text/html', 'f4m')
+UNSTREAMABLE_EXTENSIONS = ('.m3u8', '.mpd', '.f4m')
+
+
+def _segment_nonce(prefix: bytes, index: int, final: bool) -> bytes:
+    if index > MAX_SEGMENT_INDEX:
+        raise Exception("DRM container too large for segment counter")
+    return prefix + struct.pack("!IB", index, 1 if final else 0)
+
+
+class ChunkedEncryptor:
+    """Encrypts a byte stream into fixed-size authenticated segments"""
+
+    def __init__(self, key: bytes, segment_size: int = DEFAULT_SEGMENT_SIZE):
+        self.cipher = AESGCM(key)
+        self.segment_size = segment_size
+        self.nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+        self.header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, segment_size, self.nonce_prefix)
+
+    def encrypt_segment(self, index: int, data: bytes, final: bool) -> bytes:
+        """Encrypt one segment; only the last segment may be short"""
+        if len(data) > self.segment_size or (not final and len(data) != self.segment_size):
+            raise Exception("Invalid DRM segment length")
+        nonce = _segment_nonce(self.nonce_prefix, index, final)
+        return self.cipher.encrypt(nonce, data, self.header)
+
+    def encrypt_stream(self, src: BinaryIO, dst: BinaryIO, cancel_token=None) -> int:
+        """
+        Encrypt src into dst holding at most two segments in memory
+        Returns number of plaintext bytes written
+        """
+        dst.write(self.header)
+        total = 0
+        index = 0
+        current = src.read(self.segment_size)
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled()
+            following = src.read(self.segment_size) if len(current) == self.segment_size else b""
+            final = not following
+            dst.write(self.encrypt_segment(index, current, final))
+            total += len(current)
+            if final:
+                return total
+            current = following
+            index += 1
+
+
+class ChunkedDecryptor:
+    """Random-access reader for files written by ChunkedEncryptor"""
+
+    def __init__(self, path: str, key: bytes):
+        self._file = open(path, 'rb')
+        try:
+            header = self._file.read(HEADER_SIZE)
+            magic, version, segment_size, nonce_prefix = _parse_header(header)
+        except Exception:
+            self._file.close()
+            raise
+        self.header = header
+        self.segment_size = segment_size
+        self.nonce_prefix = nonce_prefix
+        self.cipher = AESGCM(key)
+
+        body_size = os.fstat(self._file.fileno()).st_size - HEADER_SIZE
+        stored_segment = segment_size + TAG_SIZE
+        if body_size < TAG_SIZE:
+            self._file.close()
+            raise Exception("Truncated DRM container")
+        self.segment_count = -(-body_size // stored_segment)
+        last_size = body_size - (self.segment_count - 1) * stored_segment
+        if last_size < TAG_SIZE:
+            self._file.close()
+            raise Exception("Truncated DRM container")
+        self.plaintext_size = (self.segment_count - 1) * segment_size + last_size - TAG_SIZE
+
+    def read_segment(self, index: int) -> bytes:
+        """Decrypt and authenticate a single segment"""
+        if not 0 <= index < self.segment_count:
+            raise IndexError(f"Segment {index} out of range")
+        stored_segment = self.segment_size + TAG_SIZE
+        self._file.seek(HEADER_SIZE + index * stored_segment)
+        data = self._file.read(stored_segment)
+        final = index == self.segment_count - 1
+        try:
+            return self.cipher.decrypt(_segment_nonce(self.nonce_prefix, index, final), data, self.header)
+        except InvalidTag:
+            raise Exception(f"DRM segment {index} failed authentication")
+
+    def iter_segments(self, start: int = 0) -> Iterator[bytes]:
+        """Yield decrypted segments in order starting from segment `start`"""
+        for index in range(start, self.segment_count):
+            yield self.read_segment(index)
+
+    def read(self, offset: int, size: int) -> bytes:
+        """Read `size` plaintext bytes at `offset`, touching only the needed segments"""
+        if offset < 0 or size < 0:
+            raise ValueError("offset and size must be non-negative")
+        end = min(offset + size, self.plaintext_size)
+        if offset >= end:
+            return b""
+        first = offset // self.segment_size
+        last = (end - 1) // self.segment_size
+        parts = [self.read_segment(i) for i in range(first, last + 1)]
+        skip = offset - first * self.segment_size
+        return b"".join(parts)[skip:skip + end - offset]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _parse_header(header: bytes):
+    if len(header) != HEADER_SIZE:
+        raise Exception("Truncated DRM container header")
+    magic, version, segment_size, nonce_prefix = struct.unpack(HEADER_FORMAT, header)
+    if magic != MAGIC:
+        raise Exception("Not a DRM container")
+    if version != FORMAT_VERSION:
+        raise Exception(f"Unsupported DRM container version {version}")
+    if segment_size <= 0:
+        raise Exception("Invalid DRM segment size")
+    return magic, version, segment_size, nonce_prefix
+
+
+def iter_decrypt_stream(src: BinaryIO, key: bytes) -> Iterator[bytes]:
+    """Decrypt a non-seekable container stream segment by segment"""
+    header = src.read(HEADER_SIZE)
+    _, _, segment_size, nonce_prefix = _parse_header(header)
+    cipher = AESGCM(key)
+    stored_segment = segment_size + TAG_SIZE
+
+    index = 0
+    current = src.read(stored_segment)
+    if len(current) < TAG_SIZE:
+        raise Exception("Truncated DRM container")
+    while True:
+        following = src.read(stored_segment) if len(current) == stored_segment else b""
+        final = not following
+        try:
+            yield cipher.decrypt(_segment_nonce(nonce_prefix, index, final), current, header)
+        except InvalidTag:
+            raise Exception(f"DRM segment {index} failed authentication")
+        if final:
+            return
+        if len(following) < TAG_SIZE:
+            raise Exception("Truncated DRM container")
+        current = following
+        index += 1
+
+
+def generate_key() -> bytes:
+    """Generate a new 256-bit content key"""
+    return AESGCM.generate_key(bit_length=256)
+
+
+def encode_key(key: bytes) -> str:
+    return base64.urlsafe_b64encode(key).decode()
+
+
+def decode_key(encoded: str) -> bytes:
+    return base64.urlsafe_b64decode(encoded.encode())
+
+
+def encrypt_file(input_file: str, output_file: str, key: bytes,
+                 segment_size: int = DEFAULT_SEGMENT_SIZE, cancel_token=None) -> int:
+    """
+    Encrypt input_file into a chunked container, returns plaintext size
+    Safe to run in a worker process; a partial output is removed on failure
+    """
+    encryptor = ChunkedEncryptor(key, segment_size)
+    try:
+        with open(input_file, 'rb') as src, open(output_file, 'wb') as dst:
+            return encryptor.encrypt_stream(src, dst, cancel_token)
+    except BaseException:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        raise
+
+
+def container_size(plaintext_size: int, segment_size: int = DEFAULT_SEGMENT_SIZE) -> int:
+    """Size of the container ChunkedEncryptor writes for plaintext_size bytes"""
+    segments = max(1, -(-plaintext_size // segment_size))
+    return HEADER_SIZE + plaintext_size + segments * TAG_SIZE
+
+
+def verify_file(input_file: str, key: bytes, sha256: str) -> None:
+    """Authenticate every segment and compare the plaintext digest"""
+    digest = hashlib.sha256()
+    with open(input_file, 'rb') as src:
+        for chunk in iter_decrypt_stream(src, key):
+            digest.update(chunk)
+    if digest.hexdigest() != sha256:
+        raise Exception("DRM container does not match the downloaded content")
+
+
+class NotStreamable(Exception):
+    """Source needs the regular download path (manifest, web page, ...)"""
+
+
+def _is_streamable(url: str, content_type: str) -> bool:
+    path = url.split('?')[0].lower()
+    return (not path.endswith(UNSTREAMABLE_EXTENSIONS)
+            and not any(kind in content_type.lower() for kind in UNSTREAMABLE_TYPES))
+
+
+async def stream_encrypt_url(url: str, output_file: str, key: bytes, session=None,
+                             progress: Optional[Callable[[int, int], None]] = None,
+                             segment_size: int = DEFAULT_SEGMENT_SIZE,
+                             buffer_segments: Optional[int] = None) -> Dict:
+    """
+    Download url straight into an encrypted container; plaintext never touches disk
+    At most `buffer_segments` segments wait between the network and the
+    encryptor, so a slow disk slows the download instead of growing memory.
+    Interrupted transfers resume with a Range request when the server allows it.
+    Returns {'size', 'sha256'} of the plaintext; raises NotStreamable before
+    writing anything if the response is not a plain file.
+    """
+    import aiohttp
+    if session is None:
+        from utilities.http_client import get_http_client
+        session = await get_http_client().get_session()
+    buffer_segments = buffer_segments or int(os.getenv("DRM_STREAM_BUFFER", DEFAULT_STREAM_BUFFER))
+
+    loop = asyncio.get_running_loop()
+    encryptor = ChunkedEncryptor(key, segment_size)
+    segments: asyncio.Queue = asyncio.Queue(buffer_segments)
+    digest = hashlib.sha256()
+
+    def write_segment(dst: BinaryIO, index: int, data: bytes, final: bool):
+        digest.update(data)
+        dst.write(encryptor.encrypt_segment(index, data, final))
+
+    write_errors = []
+
+    async def write_all(dst: BinaryIO):
+        # Keep draining after a failed write so the reader never blocks on a full queue
+        while True:
+            index, data, final = await segments.get()
+            if not write_errors:
+                try:
+                    await loop.run_in_executor(None, write_segment, dst, index, data, final)
+                except Exception as e:
+                    write_errors.append(e)
+            if final:
+                return
+
+    received = 0
+    expected: Optional[int] = None
+    validator: Optional[str] = None
+    pending = bytearray()
+    index = 0
+    attempt = 0
+    dst = None
+    writer = None
+    try:
+        while True:
+            headers = {}
+            if received:
+                headers = {'Range': f"bytes={received}-", 'If-Range': validator}
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if received:
+                        if response.status != 206:
+                            raise Exception(f"Could not resume stream (HTTP {response.status})")
+                    else:
+                        if response.status != 200:
+                            raise Exception(f"Failed to download file (HTTP {response.status})")
+                        if not _is_streamable(str(response.url), response.headers.get('Content-Type', '')):
+                            raise NotStreamable(url)
+                        if 'Content-Encoding' not in response.headers:
+                            expected = response.content_length
+                        if response.headers.get('Accept-Ranges', '').lower() == 'bytes':
+                            validator = response.headers.get('ETag') or response.headers.get('Last-Modified')
+                        # A drop before the first byte retries from scratch; keep the same file and writer
+                        if dst is None:
+                            dst = open(output_file, 'wb')
+                            dst.write(encryptor.header)
+                            writer = asyncio.ensure_future(write_all(dst))
+
+                    async for chunk in response.content.iter_any():
+                        pending += chunk
+                        received += len(chunk)
+                        # A full segment is only final once we know nothing follows it
+                        while len(pending) > segment_size:
+                            await segments.put((index, bytes(pending[:segment_size]), False))
+                            del pending[:segment_size]
+                            index += 1
+                        if write_errors:
+                            raise write_errors[0]
+                        if progress:
+                            progress(received, expected or 0)
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                attempt += 1
+                if not validator or attempt > STREAM_RETRIES:
+                    raise
+                logger.warning(f"Stream of {url} interrupted at {received} bytes ({str(e)}), resuming")
+                await asyncio.sleep(attempt)
+
+        if expected is not None and received != expected:
+            raise Exception(f"Incomplete download: got {received} of {expected} bytes")
+        await segments.put((index, bytes(pending), True))
+        await writer
+        dst.close()
+        if write_errors:
+            raise write_errors[0]
+
+        if os.path.getsize(output_file) != container_size(received, segment_size):
+            raise Exception("DRM container size does not match the downloaded content")
+        return {'size': received, 'sha256': digest.hexdigest()}
+    except BaseException:
+        if writer is not None:
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+        if dst is not None:
+            dst.close()
+            if os.path.exists(output_file):
+                os.remove(output_file)
+        raise
+
+
+def decrypt_file(input_file: str, output_file: str, key: bytes) -> int:
+    """Decrypt a chunked container back to plaintext, returns plaintext size"""
+    total = 0
+    with open(input_file, 'rb') as src, open(output_file, 'wb') as dst:
+        for chunk in iter_decrypt_stream(src, key):
+            dst.write(chunk)
+            total += len(chunk)
+    return total
+
+
 async def apply_drm(content_info: Dict) -> str:
     """
     Apply DRM protection to video content
@@ -14,33 +377,67 @@ async def apply_drm(content_info: Dict) -> str:
     try:
         if content_info['type'] != 'video':
             return content_info.get('file_path')
-        
+
         # Generate unique key for this content
-        key = Fernet.generate_key()
-        cipher = Fernet(key)
-        
+        key = generate_key()
+
         # Download video if not already downloaded
         if not content_info.get('file_path'):
             from utilities.file_utils import download_file
             content_info['file_path'] = await download_file(content_info['stream_url'], 'video')
-        
+
         input_file = content_info['file_path']
-        output_file = f"drm_protected_{os.path.basename(input_file)}"
-        
-        # Encrypt the video file
-        with open(input_file, 'rb') as f:
-            file_data = f.read()
-        
-        encrypted_data = cipher.encrypt(file_data)
-        
-        with open(output_file, 'wb') as f:
-            f.write(encrypted_data)
-        
+        output_file = os.path.join(os.path.dirname(input_file), f"drm_protected_{os.path.basename(input_file)}")
+
+        # Encrypt the video file segment by segment in the crypto worker pool
+        # so memory stays bounded and the event loop keeps serving other users
+        from utilities.worker_pool import get_crypto_pool, CancelToken
+        await get_crypto_pool().run(encrypt_file, input_file, output_file, key, cancel_token=CancelToken())
+        content_info['drm_key'] = encode_key(key)
+
         # Clean up original file
         os.remove(input_file)
-        
+
         return output_file
-    
+
     except Exception as e:
         logger.error(f"DRM application failed: {str(e)}", exc_info=True)
         raise
+
+
+def streams_protected(content_info: Dict) -> bool:
+    """Whether download_protected() will try streaming this content"""
+    return content_info['type'] == 'video' and os.getenv("DRM_STREAMING", "0") == "1"
+
+
+async def download_protected(content_info: Dict,
+                             progress: Optional[Callable[[int, int], None]] = None) -> Optional[str]:
+    """
+    Streaming alternative to download_file + apply_drm for video content
+    Returns path to the DRM-protected file, or None when streaming is
+    disabled or the source has to go through the regular download path
+    """
+    if not streams_protected(content_info):
+        return None
+
+    url = content_info.get('preferred_quality') or content_info.get('download_url') or content_info.get('stream_url')
+    file_name = url.split('/')[-1].split('?')[0] or "video"
+    from utilities.scratch import scratch_path
+    output_file = scratch_path(f"drm_protected_{file_name}")
+    key = generate_key()
+    try:
+        result = await stream_encrypt_url(url, output_file, key, progress=progress)
+    except NotStreamable:
+        logger.info(f"{url} is not a plain file, downloading it before applying DRM")
+        return None
+
+    if os.getenv("DRM_STREAM_VERIFY", "0") == "1":
+        from utilities.worker_pool import get_crypto_pool
+        try:
+            await get_crypto_pool().run(verify_file, output_file, key, result['sha256'])
+        except BaseException:
+            os.remove(output_file)
+            raise
+    content_info['drm_key'] = encode_key(key)
+    content_info['content_sha256'] = result['sha256']
+    return output_file
@@ -0,0 +1,12 @@
+from typing import Dict, Optional
+
+
+def parse_overrides(spec: Optional[str], defaults: Dict[str, int]) -> Dict[str, int]:
+    """Parse "utkarsh=4,appx=2" style per-name overrides of integer settings"""
+    values = dict(defaults)
+    if spec:
+        for part in spec.split(','):
+            name, _, value = part.partition('=')
+            if name.strip() and value.strip():
+                values[name.strip().lower()] = int(value)
+    return values
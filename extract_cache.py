@@ -0,0 +1,153 @@
+import os
+import copy
+import time
+import asyncio
+import logging
+from datetime import datetime
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set
+from utilities.single_flight import SingleFlight
+from utilities.env_utils import parse_overrides
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_TTLS = {
+    'utkarsh': 1800,
+    'appx': 1800,
+    'classplus': 600,
+    'universal': 300,
+}
+NEGATIVE_TTL = 60
+
+
+class ExtractionCache:
+    """
+    Two-tier cache for extractor results
+
+    Tier one is an in-process LRU; tier two is an optional MongoDB collection
+    shared across restarts and processes. Failures are cached briefly so a
+    broken course isn't re-fetched on every message. With stale-while-revalidate
+    enabled, an expired entry is still served for one more TTL while a
+    background refresh replaces it. Concurrent misses for the same key share
+    a single extractor call.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttls: Optional[Dict[str, int]] = None,
+                 negative_ttl: Optional[int] = None, stale_while_revalidate: Optional[bool] = None):
+        self.max_entries = max_entries or int(os.getenv("EXTRACT_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+        self.ttls = ttls or parse_overrides(os.getenv("EXTRACT_CACHE_TTLS"), DEFAULT_TTLS)
+        self.negative_ttl = negative_ttl or int(os.getenv("EXTRACT_CACHE_NEGATIVE_TTL", NEGATIVE_TTL))
+        if stale_while_revalidate is None:
+            stale_while_revalidate = os.getenv("EXTRACT_CACHE_SWR", "1") == "1"
+        self.stale_while_revalidate = stale_while_revalidate
+        self.collection = None
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._refreshing: Set[str] = set()
+        self._inflight = SingleFlight("extraction")
+
+    async def attach_collection(self, collection):
+        """Use a MongoDB collection as the shared second tier"""
+        self.collection = collection
+        try:
+            await self._run(collection.create_index, 'expires_at', expireAfterSeconds=0)
+        except Exception as e:
+            logger.warning(f"Could not create extraction cache index: {str(e)}")
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+
+    def _ttl(self, platform: str) -> int:
+        return self.ttls.get(platform, self.ttls['universal'])
+
+    def _remember(self, key: str, entry: Dict):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _load(self, key: str) -> Optional[Dict]:
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry
+        if self.collection is None:
+            return None
+        try:
+            doc = await self._run(self.collection.find_one, {'_id': key})
+        except Exception as e:
+            logger.warning(f"Extraction cache lookup failed: {str(e)}")
+            return None
+        if doc:
+            entry = {'value': doc.get('value'), 'error': doc.get('error'), 'stored_at': doc['stored_at']}
+            self._remember(key, entry)
+        return entry
+
+    async def _store(self, key: str, entry: Dict, ttl: int):
+        self._remember(key, entry)
+        if self.collection is None:
+            return
+        # Keep the shared copy around for the stale window too
+        lifetime = ttl * 2 if self.stale_while_revalidate and entry['error'] is None else ttl
+        doc = dict(entry, expires_at=datetime.utcfromtimestamp(entry['stored_at'] + lifetime))
+        try:
+            await self._run(self.collection.replace_one, {'_id': key}, doc, upsert=True)
+        except Exception as e:
+            logger.warning(f"Extraction cache write failed: {str(e)}")
+
+    async def _fetch(self, key: str, platform: str, fetch: Callable[[], Awaitable[Dict]]) -> Dict:
+        try:
+            value = await fetch()
+        except Exception as e:
+            await self._store(key, {'value': None, 'error': str(e), 'stored_at': time.time()},
+                              self.negative_ttl)
+            raise
+        await self._store(key, {'value': value, 'error': None, 'stored_at': time.time()},
+                          self._ttl(platform))
+        return value
+
+    async def _refresh(self, key: str, platform: str, fetch: Callable[[], Awaitable[Dict]]):
+        # A failed refresh keeps serving the stale value instead of caching the error
+        try:
+            value = await fetch()
+            await self._store(key, {'value': value, 'error': None, 'stored_at': time.time()},
+                              self._ttl(platform))
+        except Exception as e:
+            logger.info(f"Background refresh of {key} failed: {str(e)}")
+        finally:
+            self._refreshing.discard(key)
+
+    async def get_or_fetch(self, platform: str, cache_id: str,
+                           fetch: Callable[[], Awaitable[Dict]]) -> Dict:
+        """Return the cached result for (platform, cache_id), calling fetch when needed"""
+        key = f"{platform}:{cache_id}"
+        entry = await self._load(key)
+        if entry is not None:
+            age = time.time() - entry['stored_at']
+            if entry['error'] is not None:
+                if age < self.negative_ttl:
+                    raise Exception(entry['error'])
+            else:
+                ttl = self._ttl(platform)
+                if age < ttl:
+                    return copy.deepcopy(entry['value'])
+                if self.stale_while_revalidate and age < ttl * 2:
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        asyncio.ensure_future(self._refresh(key, platform, fetch))
+                    return copy.deepcopy(entry['value'])
+
+        value = await self._inflight.do(key, lambda: self._fetch(key, platform, fetch))
+        return copy.deepcopy(value)
+
+
+_extraction_cache: Optional[ExtractionCache] = None
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Get the application-wide extraction cache"""
+    global _extraction_cache
+    if _extraction_cache is None:
+        _extraction_cache = ExtractionCache()
+    return _extraction_cache
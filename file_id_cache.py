@@ -0,0 +1,125 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+from utilities.url_utils import normalize_url
+from utilities.download_cache import get_download_cache
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever downloaded content is processed differently (DRM format,
+# transcoding, ...) so files uploaded by older versions stop being reused
+PROCESSING_VERSION = 1
+# Reuse limit for origins that give nothing to revalidate against
+DEFAULT_MAX_AGE = 86400
+
+
+def source_url(content_info: Dict) -> str:
+    """URL of the file actually downloaded for this content"""
+    return content_info.get('preferred_quality') or content_info.get('download_url') or content_info.get('stream_url')
+
+
+def quality_label(content_info: Dict) -> str:
+    """Resolution of the selected quality; stable where quality URLs carry expiring tokens"""
+    preferred = content_info.get('preferred_quality')
+    for quality in content_info.get('qualities') or []:
+        if quality.get('url') == preferred:
+            return str(quality.get('resolution', 'default'))
+    return 'default'
+
+
+class FileIdCache:
+    """
+    Telegram file_id of content that has already been uploaded
+
+    Keyed by source link + selected quality + PROCESSING_VERSION, so a repeat
+    request is answered by resending the file_id: no download, no DRM and no
+    upload. Each entry keeps the origin's validators (ETag / Last-Modified /
+    Content-Length) from when it was processed and is dropped once they no
+    longer match. Origins without validators are reprocessed after
+    FILE_ID_CACHE_MAX_AGE seconds.
+    """
+
+    def __init__(self, max_age: Optional[int] = None):
+        self.max_age = max_age or int(os.getenv("FILE_ID_CACHE_MAX_AGE", DEFAULT_MAX_AGE))
+        self.collection = None
+
+    def attach_collection(self, collection):
+        """Keep file_ids in a MongoDB collection shared by the bot and its workers"""
+        self.collection = collection
+
+    def content_key(self, content_url: str, content_info: Dict) -> str:
+        material = "\n".join([normalize_url(content_url), quality_label(content_info), str(PROCESSING_VERSION)])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+
+    def _fresh(self, entry: Dict, validators: Dict[str, Optional[str]]) -> bool:
+        if any(validators.values()) and any(entry.get('validators', {}).values()):
+            return entry['validators'] == validators
+        return time.time() - entry['stored_at'] < self.max_age
+
+    async def lookup(self, content_url: str, content_info: Dict) -> Tuple[Optional[Dict], Dict]:
+        """
+        Return (entry, validators) for the content; entry is None on a miss
+        Pass the validators to remember() after processing
+        """
+        validators = await get_download_cache().probe(source_url(content_info))
+        if self.collection is None:
+            return None, validators
+
+        key = self.content_key(content_url, content_info)
+        try:
+            entry = await self._run(self.collection.find_one, {'_id': key})
+        except Exception as e:
+            logger.warning(f"file_id lookup failed: {str(e)}")
+            return None, validators
+        if entry and not self._fresh(entry, validators):
+            logger.info(f"Source of {content_url} changed, uploading it again")
+            await self.invalidate(content_url, content_info)
+            entry = None
+        return entry, validators
+
+    async def remember(self, content_url: str, content_info: Dict, message, validators: Dict):
+        """Store the file_id of an uploaded message"""
+        media = message.video or message.document or message.animation
+        if self.collection is None or media is None:
+            return
+        entry = {
+            'file_id': media.file_id,
+            'type': content_info['type'],
+            'source_url': normalize_url(content_url),
+            'quality': quality_label(content_info),
+            'version': PROCESSING_VERSION,
+            'validators': validators,
+            'drm_key': content_info.get('drm_key'),
+            'stored_at': time.time(),
+        }
+        try:
+            await self._run(self.collection.replace_one,
+                            {'_id': self.content_key(content_url, content_info)}, entry, upsert=True)
+        except Exception as e:
+            logger.warning(f"Could not remember file_id: {str(e)}")
+
+    async def invalidate(self, content_url: str, content_info: Dict):
+        if self.collection is None:
+            return
+        try:
+            await self._run(self.collection.delete_one, {'_id': self.content_key(content_url, content_info)})
+        except Exception as e:
+            logger.warning(f"file_id invalidation failed: {str(e)}")
+
+
+_file_id_cache: Optional[FileIdCache] = None
+
+
+def get_file_id_cache() -> FileIdCache:
+    """Get the application-wide file_id cache"""
+    global _file_id_cache
+    if _file_id_cache is None:
+        _file_id_cache = FileIdCache()
+    return _file_id_cache
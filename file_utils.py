@@ -1,72 +1,101 @@
 import os
 import re
+import asyncio
 import aiohttp
-import yt_dlp
-from typing import List
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from utilities.http_client import get_http_client
+from utilities.downloader import SegmentedDownloader
+from utilities.worker_pool import CancelToken, get_download_pool
+from utilities.url_utils import canonical_link
+from utilities.scratch import scratch_path
+
+# Fragments fetched in parallel for HLS/DASH videos
+YTDLP_FRAGMENTS = int(os.getenv("YTDLP_FRAGMENTS", 4))
+
+URL_PATTERN = re.compile(r'https?://\S+')
+TRAILING_PUNCTUATION = re.compile(r'[.,;!?)]+$')
+INGEST_YIELD_EVERY = 1000
+
+async def iter_links(file_path: str) -> AsyncIterator[str]:
+    """
+    Stream unique URLs from a text file line by line
+    Duplicates are detected on the canonical form (lowercase host, no
+    fragment, no tracking parameters); the file is removed afterwards
+    """
+    seen = set()
+    try:
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            for line_no, line in enumerate(f, start=1):
+                for match in URL_PATTERN.finditer(line):
+                    # Clean up URLs (remove trailing punctuation)
+                    url = TRAILING_PUNCTUATION.sub('', match.group(0))
+                    key = canonical_link(url)
+                    if key not in seen:
+                        seen.add(key)
+                        yield url
+                # Let other handlers run while a large file is being read
+                if line_no % INGEST_YIELD_EVERY == 0:
+                    await asyncio.sleep(0)
+    finally:
+        # Clean up the downloaded file
+        os.remove(file_path)
 
 async def process_text_file(file_path: str) -> List[str]:
     """Extract valid URLs from text file"""
-    with open(file_path, 'r') as f:
-        content = f.read()
-    
-    # Find all HTTP/HTTPS URLs
-    urls = re.findall(r'https?://\S+', content)
-    
-    # Clean up URLs (remove trailing punctuation)
-    cleaned_urls = []
-    for url in urls:
-        url = re.sub(r'[.,;!?)]+$', '', url)
-        if url not in cleaned_urls:  # Avoid duplicates
-            cleaned_urls.append(url)
-    
-    # Clean up the downloaded file
-    os.remove(file_path)
-    
-    return cleaned_urls
+    return [url async for url in iter_links(file_path)]
 
-async def download_file(url: str, file_type: str) -> str:
-    """Download file from URL with appropriate method"""
+async def download_file(url: str, file_type: str, quality: Optional[str] = None,
+                        progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """
+    Download file from URL with appropriate method
+    `quality` is the URL of the preferred rendition and replaces `url` when given;
+    `progress` is called on the event loop with (downloaded_bytes, total_bytes)
+    """
+    url = quality or url
     if file_type == 'video':
-        return await download_video(url)
+        return await download_video(url, progress)
     else:
-        return await download_direct(url)
+        return await download_direct(url, progress=progress)
 
-async def download_video(url: str) -> str:
-    """Download video using yt-dlp"""
+def _run_ytdlp(url: str, ydl_opts: Dict, cancel_token: Optional[CancelToken] = None) -> str:
+    """Blocking yt-dlp download, runs inside the download worker pool"""
+    # yt-dlp takes a while to import, so load it on the first video download
+    import yt_dlp
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=True)
+        return ydl.prepare_filename(info)
+
+async def download_video(url: str, progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """Download video using yt-dlp without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    cancel_token = CancelToken()
+    
+    def hook(d: Dict):
+        # Runs on the yt-dlp thread; raising here aborts the download
+        cancel_token.raise_if_cancelled()
+        if progress and d.get('status') in ('downloading', 'finished'):
+            done = d.get('downloaded_bytes') or 0
+            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            loop.call_soon_threadsafe(progress, done, int(total))
+    
     ydl_opts = {
         'format': 'best',
-        'outtmpl': 'downloaded_%(id)s.%(ext)s',
+        'outtmpl': scratch_path('downloaded_%(id)s.%(ext)s'),
         'quiet': True,
+        'noprogress': True,
+        'concurrent_fragment_downloads': YTDLP_FRAGMENTS,
+        'progress_hooks': [hook],
     }
     
-    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-        info = ydl.extract_info(url, download=True)
-        return ydl.prepare_filename(info)
+    return await get_download_pool().run(_run_ytdlp, url, ydl_opts, cancel_token=cancel_token)
 
-async def download_direct(url: str) -> str:
-    """Download file directly"""
+async def download_direct(url: str, session: Optional[aiohttp.ClientSession] = None,
+                          progress: Optional[Callable[[int, int], None]] = None) -> str:
+    """Download file directly, in parallel ranges when the server allows it"""
     file_name = url.split('/')[-1].split('?')[0]
-    file_path = f"downloaded_{file_name}"
+    file_path = scratch_path(f"downloaded_{file_name}")
     
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status != 200:
-                raise Exception(f"Failed to download file (HTTP {response.status})")
-            
-            with open(file_path, 'wb') as f:
-                while True:
-                    chunk = await response.content.read(1024)
-                    if not chunk:
-                        break
-                    f.write(chunk)
+    if session is None:
+        session = await get_http_client().get_session()
     
-    return file_path
-
-def clean_temp_files():
-    """Clean up temporary downloaded files"""
-    for file in os.listdir('.'):
-        if file.startswith('downloaded_') or file.startswith('temp_'):
-            try:
-                os.remove(file)
-            except:
-                pass
+    return await SegmentedDownloader(session, progress=progress).download(url, file_path)
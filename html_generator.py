@@ -0,0 +1,473 @@
+import os
+import asyncio
+import zipfile
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from jinja2 import Environment, select_autoescape
+from utilities.scratch import scratch_path
+
+# Items per page in paginated mode; 0 renders everything into one file
+PORTAL_PAGE_SIZE = int(os.getenv("PORTAL_PAGE_SIZE", 0))
+
+# HTML template for the portal
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Course Portal - {{title}}{% if page_count > 1 %} ({{page}}/{{page_count}}){% endif %}</title>
+    <style>
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            line-height: 1.6;
+            margin: 0;
+            padding: 0;
+            background-color: #f5f5f5;
+            color: #333;
+        }
+        .container {
+            max-width: 1200px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+        header {
+            background: linear-gradient(135deg, #6e48aa 0%, #9d50bb 100%);
+            color: white;
+            padding: 20px 0;
+            text-align: center;
+            border-radius: 0 0 10px 10px;
+            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+            margin-bottom: 30px;
+        }
+        h1 {
+            margin: 0;
+            font-size: 2.2em;
+        }
+        .search-box {
+            margin: 20px 0;
+            text-align: center;
+        }
+        #searchInput {
+            padding: 10px 15px;
+            width: 70%;
+            border: 1px solid #ddd;
+            border-radius: 25px;
+            font-size: 16px;
+            outline: none;
+        }
+        .content-viewport {
+            position: relative;
+            margin-top: 20px;
+        }
+        .content-grid {
+            display: grid;
+            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
+            gap: 20px;
+            position: absolute;
+            top: 0;
+            left: 0;
+            right: 0;
+        }
+        .content-card {
+            height: 400px;
+            box-sizing: border-box;
+            background: white;
+            border-radius: 8px;
+            overflow: hidden;
+            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
+            transition: transform 0.3s ease;
+        }
+        .content-card:hover {
+            transform: translateY(-5px);
+            box-shadow: 0 5px 15px rgba(0, 0, 0, 0.2);
+        }
+        .card-image {
+            height: 180px;
+            overflow: hidden;
+        }
+        .card-image img {
+            width: 100%;
+            height: 100%;
+            object-fit: cover;
+        }
+        .card-body {
+            padding: 15px;
+        }
+        .card-title {
+            font-size: 1.2em;
+            margin: 0 0 10px 0;
+            color: #333;
+            display: -webkit-box;
+            -webkit-line-clamp: 2;
+            -webkit-box-orient: vertical;
+            overflow: hidden;
+        }
+        .card-meta {
+            font-size: 0.9em;
+            color: #666;
+            margin-bottom: 15px;
+        }
+        .quality-selector {
+            margin-bottom: 10px;
+        }
+        select {
+            padding: 5px;
+            border-radius: 4px;
+            border: 1px solid #ddd;
+        }
+        .download-btn {
+            display: inline-block;
+            background: linear-gradient(135deg, #6e48aa 0%, #9d50bb 100%);
+            color: white;
+            padding: 8px 15px;
+            text-decoration: none;
+            border-radius: 4px;
+            font-weight: bold;
+            transition: background 0.3s ease;
+        }
+        .download-btn:hover {
+            background: linear-gradient(135deg, #5d3a99 0%, #8c40ab 100%);
+        }
+        .no-results {
+            text-align: center;
+            grid-column: 1 / -1;
+            padding: 40px;
+            color: #666;
+        }
+        .page-nav {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            margin-top: 30px;
+        }
+        .page-nav a {
+            color: #6e48aa;
+            font-weight: bold;
+            text-decoration: none;
+        }
+        footer {
+            text-align: center;
+            margin-top: 40px;
+            padding: 20px;
+            color: #666;
+            font-size: 0.9em;
+        }
+        @media (max-width: 768px) {
+            #searchInput {
+                width: 90%;
+            }
+        }
+    </style>
+</head>
+<body>
+    <header>
+        <div class="container">
+            <h1>{{title}}</h1>
+            <p>Access all your course materials in one place</p>
+        </div>
+    </header>
+
+    <div class="container">
+        <div class="search-box">
+            <input type="text" id="searchInput" placeholder="Search for videos, PDFs..." oninput="searchContent()">
+        </div>
+
+        <!-- Only the cards inside the visible window are kept in the DOM -->
+        <div class="content-viewport" id="contentViewport">
+            <div class="content-grid" id="contentGrid"></div>
+        </div>
+        <div class="no-results" id="noResults" style="display: none"></div>
+        <noscript>
+            <div class="no-results"><p>Please enable JavaScript to browse this portal.</p></div>
+        </noscript>
+
+        {% if page_count > 1 %}
+        <nav class="page-nav">
+            <span>{% if page > 1 %}<a href="{{pages[page - 2]}}">&larr; Previous</a>{% endif %}</span>
+            <a href="{{index_file}}">All pages ({{page}}/{{page_count}})</a>
+            <span>{% if page < page_count %}<a href="{{pages[page]}}">Next &rarr;</a>{% endif %}</span>
+        </nav>
+        {% endif %}
+    </div>
+
+    <footer>
+        <div class="container">
+            <p>Generated by DRM Uploader Bot • {{timestamp}}</p>
+        </div>
+    </footer>
+
+    <script type="application/json" id="portalData">[{% for item in content_items %}{{item|tojson}}{% if not loop.last %},{% endif %}{% endfor %}]</script>
+
+    <script>
+        (function () {
+            var CARD_HEIGHT = 400;
+            var GAP = 20;
+            var MIN_CARD_WIDTH = 300;
+            var OVERSCAN_ROWS = 2;
+            var SEARCH_DEBOUNCE_MS = 150;
+            var PLACEHOLDER = 'https://via.placeholder.com/300x180?text=No+Thumbnail';
+
+            // Each item: t=title, y=type, th=thumbnail, d=duration, u=download url,
+            // q=[[url, resolution, size]], s=prebuilt lowercase search text
+            var items = JSON.parse(document.getElementById('portalData').textContent);
+            var viewport = document.getElementById('contentViewport');
+            var grid = document.getElementById('contentGrid');
+            var noResults = document.getElementById('noResults');
+            var visible = items.map(function (_, i) { return i; });
+            var renderedRange = '';
+            var searchTimer = null;
+            var frameRequested = false;
+
+            function el(tag, className, text) {
+                var node = document.createElement(tag);
+                if (className) node.className = className;
+                if (text !== undefined) node.textContent = text;
+                return node;
+            }
+
+            function buildCard(index) {
+                var item = items[index];
+                var card = el('div', 'content-card');
+
+                var image = el('div', 'card-image');
+                var img = el('img');
+                img.src = item.th || PLACEHOLDER;
+                img.alt = item.t;
+                img.loading = 'lazy';
+                image.appendChild(img);
+                card.appendChild(image);
+
+                var body = el('div', 'card-body');
+                body.appendChild(el('h3', 'card-title', item.t));
+                body.appendChild(el('div', 'card-meta', item.y.toUpperCase() + ' \u2022 ' + item.d));
+
+                if (item.y === 'video' && item.q.length) {
+                    var selector = el('div', 'quality-selector');
+                    var select = el('select');
+                    select.id = 'quality-' + (index + 1);
+                    item.q.forEach(function (quality) {
+                        var option = el('option', null, quality[1] + ' (' + quality[2] + ')');
+                        option.value = quality[0];
+                        select.appendChild(option);
+                    });
+                    selector.appendChild(select);
+                    body.appendChild(selector);
+                }
+
+                var link = el('a', 'download-btn', 'Download ' + item.y.toUpperCase());
+                link.href = item.u;
+                link.setAttribute('download', '');
+                body.appendChild(link);
+                card.appendChild(body);
+                return card;
+            }
+
+            function render(force) {
+                var cols = Math.max(1, Math.floor((viewport.clientWidth + GAP) / (MIN_CARD_WIDTH + GAP)));
+                var rowHeight = CARD_HEIGHT + GAP;
+                var rows = Math.ceil(visible.length / cols);
+                viewport.style.height = Math.max(0, rows * rowHeight - GAP) + 'px';
+
+                if (!visible.length) {
+                    noResults.textContent = items.length
+                        ? 'No matching content found.'
+                        : 'No content available yet. Please check back later.';
+                    noResults.style.display = '';
+                } else {
+                    noResults.style.display = 'none';
+                }
+
+                var top = viewport.getBoundingClientRect().top;
+                var firstRow = Math.max(0, Math.floor(-top / rowHeight) - OVERSCAN_ROWS);
+                var lastRow = Math.min(rows, Math.ceil((window.innerHeight - top) / rowHeight) + OVERSCAN_ROWS);
+                var range = cols + ':' + firstRow + ':' + lastRow;
+                if (!force && range === renderedRange) return;
+                renderedRange = range;
+
+                var fragment = document.createDocumentFragment();
+                var end = Math.min(visible.length, lastRow * cols);
+                for (var i = firstRow * cols; i < end; i++) {
+                    fragment.appendChild(buildCard(visible[i]));
+                }
+                grid.style.gridTemplateColumns = 'repeat(' + cols + ', 1fr)';
+                grid.style.transform = 'translateY(' + firstRow * rowHeight + 'px)';
+                grid.textContent = '';
+                grid.appendChild(fragment);
+            }
+
+            function scheduleRender() {
+                if (frameRequested) return;
+                frameRequested = true;
+                window.requestAnimationFrame(function () {
+                    frameRequested = false;
+                    render(false);
+                });
+            }
+
+            window.searchContent = function () {
+                clearTimeout(searchTimer);
+                searchTimer = setTimeout(function () {
+                    var terms = document.getElementById('searchInput').value.toLowerCase().split(/\s+/).filter(Boolean);
+                    visible = [];
+                    for (var i = 0; i < items.length; i++) {
+                        var text = items[i].s;
+                        if (terms.every(function (term) { return text.indexOf(term) !== -1; })) {
+                            visible.push(i);
+                        }
+                    }
+                    render(true);
+                }, SEARCH_DEBOUNCE_MS);
+            };
+
+            window.addEventListener('scroll', scheduleRender, { passive: true });
+            window.addEventListener('resize', scheduleRender);
+            render(true);
+        })();
+    </script>
+</body>
+</html>
+"""
+
+# Index page linking the pages of a paginated portal
+INDEX_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Course Portal - {{title}}</title>
+    <style>
+        body {
+            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
+            margin: 0;
+            background-color: #f5f5f5;
+            color: #333;
+        }
+        header {
+            background: linear-gradient(135deg, #6e48aa 0%, #9d50bb 100%);
+            color: white;
+            padding: 20px;
+            text-align: center;
+        }
+        ul {
+            max-width: 600px;
+            margin: 30px auto;
+            padding: 0;
+            list-style: none;
+        }
+        li a {
+            display: block;
+            background: white;
+            margin-bottom: 10px;
+            padding: 15px;
+            border-radius: 8px;
+            color: #6e48aa;
+            text-decoration: none;
+            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
+        }
+    </style>
+</head>
+<body>
+    <header>
+        <h1>{{title}}</h1>
+        <p>{{total}} items in {{pages|length}} pages</p>
+    </header>
+    <ul>
+        {% for page in pages %}
+        <li><a href="{{page.file}}">Page {{loop.index}}: items {{page.first}}-{{page.last}}</a></li>
+        {% endfor %}
+    </ul>
+</body>
+</html>
+"""
+
+# Templates are compiled once at import instead of on every portal
+_env = Environment(autoescape=select_autoescape(default=True), auto_reload=False)
+_portal_template = _env.from_string(HTML_TEMPLATE)
+_index_template = _env.from_string(INDEX_TEMPLATE)
+
+
+def _card_data(content_items: List[Dict]) -> Iterator[Dict]:
+    """Compact per-item records embedded as the portal's client-side index"""
+    for item in content_items:
+        title = item.get('title') or ''
+        item_type = item.get('type') or ''
+        yield {
+            't': title,
+            'y': item_type,
+            'th': item.get('thumbnail'),
+            'd': item.get('duration') or 'N/A',
+            'u': item.get('download_url'),
+            'q': [[q.get('url'), q.get('resolution'), q.get('size')] for q in item.get('qualities') or []],
+            's': f"{title} {item_type}".lower(),
+        }
+
+
+def _render_to_file(template, path: str, data: Dict):
+    """Stream template output to disk chunk by chunk instead of building one string"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in template.generate(data):
+            f.write(chunk)
+
+
+def _write_portal(title: str, content_items: List[Dict], page_size: int, base: str) -> str:
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    output_file = f"{base}.html"
+
+    if not page_size or len(content_items) <= page_size:
+        _render_to_file(_portal_template, output_file, {
+            'title': title,
+            'content_items': _card_data(content_items),
+            'timestamp': timestamp,
+            'page': 1,
+            'page_count': 1,
+        })
+        return output_file
+
+    # Paginated mode: one file per page plus an index, bundled as a zip
+    page_count = -(-len(content_items) // page_size)
+    pages = [f"page_{n}.html" for n in range(1, page_count + 1)]
+    bundle = f"{base}.zip"
+    with zipfile.ZipFile(bundle, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for n, page_file in enumerate(pages, start=1):
+            start = (n - 1) * page_size
+            work_file = f"{base}_{page_file}"
+            _render_to_file(_portal_template, work_file, {
+                'title': title,
+                'content_items': _card_data(content_items[start:start + page_size]),
+                'timestamp': timestamp,
+                'page': n,
+                'page_count': page_count,
+                'pages': pages,
+                'index_file': 'index.html',
+            })
+            zf.write(work_file, page_file)
+            os.remove(work_file)
+
+        _render_to_file(_index_template, output_file, {
+            'title': title,
+            'total': len(content_items),
+            'pages': [
+                {'file': page_file, 'first': (n - 1) * page_size + 1,
+                 'last': min(n * page_size, len(content_items))}
+                for n, page_file in enumerate(pages, start=1)
+            ],
+        })
+        zf.write(output_file, 'index.html')
+        os.remove(output_file)
+    return bundle
+
+
+async def generate_html_portal(title: str, content_items: List[Dict],
+                               page_size: Optional[int] = None) -> str:
+    """
+    Generate HTML portal from content items
+    Returns a single HTML file, or a zip of linked pages when the portal is
+    larger than `page_size` items (PORTAL_PAGE_SIZE by default)
+    """
+    if page_size is None:
+        page_size = PORTAL_PAGE_SIZE
+    base = scratch_path(f"course_portal_{int(datetime.now().timestamp())}")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _write_portal, title, content_items, page_size, base)
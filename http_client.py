@@ -0,0 +1,69 @@
+import os
+import logging
+import aiohttp
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPClientManager:
+    """
+    Application-wide aiohttp session with keep-alive connection pooling
+
+    All extractors and downloaders share one connector, so repeated requests
+    to the same host reuse TCP/TLS connections and cached DNS answers instead
+    of paying a fresh handshake per link.
+    """
+
+    def __init__(self, limit: Optional[int] = None, limit_per_host: Optional[int] = None,
+                 dns_ttl: Optional[int] = None, keepalive_timeout: Optional[float] = None,
+                 connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None):
+        self.limit = limit or int(os.getenv("HTTP_POOL_LIMIT", 100))
+        self.limit_per_host = limit_per_host or int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 10))
+        self.dns_ttl = dns_ttl or int(os.getenv("HTTP_DNS_TTL", 300))
+        self.keepalive_timeout = keepalive_timeout or float(os.getenv("HTTP_KEEPALIVE", 30))
+        self.connect_timeout = connect_timeout or float(os.getenv("HTTP_CONNECT_TIMEOUT", 15))
+        self.read_timeout = read_timeout or float(os.getenv("HTTP_READ_TIMEOUT", 60))
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Get the shared session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            # No total timeout: large downloads may legitimately take hours
+            timeout = aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=self.connect_timeout,
+                sock_read=self.read_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self):
+        """Close the shared session and its pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_http_client: Optional[HTTPClientManager] = None
+
+
+def get_http_client() -> HTTPClientManager:
+    """Get the application-wide HTTP client manager"""
+    global _http_client
+    if _http_client is None:
+        _http_client = HTTPClientManager()
+    return _http_client
+
+
+async def close_http_client():
+    """Close the application-wide session on shutdown"""
+    if _http_client is not None:
+        await _http_client.close()
@@ -1,17 +1,81 @@
-from extractors.utkarsh import UtkarshExtractor
-from extractors.appx import AppxExtractor
-from extractors.classplus import ClassPlusExtractor
-from extractors.universal import UniversalExtractor
+import re
+import logging
+import importlib
+from urllib.parse import urlparse
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractorRegistry:
+    """
+    Maps URLs to extractors without importing every extractor up front
+
+    Each platform declares the domains it serves (subdomains included) and
+    optional regex patterns. Dispatch is a dictionary lookup on the URL's
+    host and its parent domains, then the regex list, then the fallback.
+    Extractor modules are imported the first time a URL needs them, and the
+    class's own is_valid_url has the final say.
+    """
+
+    def __init__(self):
+        self._targets: Dict[str, str] = {}
+        self._by_domain: Dict[str, str] = {}
+        self._patterns: List[Tuple[Pattern, str]] = []
+        self._instances: Dict[str, object] = {}
+        self._fallback: Optional[str] = None
+
+    def register(self, name: str, target: str, domains: Iterable[str] = (),
+                 patterns: Iterable[str] = (), fallback: bool = False):
+        """Register `target` ("module:Class") under `name` for the given domains/patterns"""
+        self._targets[name] = target
+        for domain in domains:
+            self._by_domain[domain.lower()] = name
+        for pattern in patterns:
+            self._patterns.append((re.compile(pattern, re.I), name))
+        if fallback:
+            self._fallback = name
+
+    def _candidates(self, url: str) -> List[str]:
+        names = []
+        host = (urlparse(url).hostname or '').lower()
+        labels = host.split('.')
+        for i in range(len(labels) - 1):
+            name = self._by_domain.get('.'.join(labels[i:]))
+            if name:
+                names.append(name)
+                break
+        for pattern, name in self._patterns:
+            if name not in names and pattern.search(url):
+                names.append(name)
+        return names
+
+    def _instance(self, name: str):
+        if name not in self._instances:
+            module_name, _, class_name = self._targets[name].partition(':')
+            module = importlib.import_module(module_name)
+            self._instances[name] = getattr(module, class_name)()
+            logger.debug(f"Loaded extractor {name} from {module_name}")
+        return self._instances[name]
+
+    def get_extractor(self, url: str):
+        """Get appropriate extractor for the URL"""
+        for name in self._candidates(url):
+            extractor = self._instance(name)
+            if extractor.is_valid_url(url):
+                return extractor
+        if self._fallback:
+            return self._instance(self._fallback)
+        return None
+
+
+registry = ExtractorRegistry()
+registry.register('utkarsh', 'extractors.utkarsh:UtkarshExtractor', domains=['utkarsh.com'])
+registry.register('appx', 'extractors.appx:AppxExtractor', domains=['appx.com'])
+registry.register('classplus', 'extractors.classplus:ClassPlusExtractor', domains=['classplus.app'])
+registry.register('universal', 'extractors.universal:UniversalExtractor', fallback=True)
+
 
 def get_extractor(url: str):
     """Get appropriate extractor for the URL"""
-    url = url.lower()
-    
-    if 'utkarsh' in url:
-        return UtkarshExtractor()
-    elif 'appx' in url:
-        return AppxExtractor()
-    elif 'classplus' in url:
-        return ClassPlusExtractor()
-    else:
-        return UniversalExtractor()
+    return registry.get_extractor(url)
@@ -0,0 +1,558 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from pymongo import ASCENDING, ReturnDocument
+from utilities.worker_pool import job_priority
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_SINGLE = 0
+PRIORITY_BULK = 10
+
+DEFAULT_WORKERS = 4
+DEFAULT_USER_LIMIT = 2
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_SQLITE_PATH = "jobs.db"
+# Jobs whose worker died this many times are failed instead of taken over
+MAX_ATTEMPTS = 3
+# Finished jobs are kept this long for inspection
+HISTORY_SECONDS = 86400
+
+
+class JobStore(ABC):
+    """
+    Persistent job storage; every method is blocking
+
+    A job is a dict with _id, kind, user_id, chat_id, message_id, payload,
+    priority, status (queued / running / done / failed), created_at,
+    started_at, finished_at, error, attempts, worker, lease_until and
+    progress (None, then 'sending' / 'sent' once the result goes out).
+
+    A running job belongs to `worker` until `lease_until`. The worker keeps
+    extending the lease; once it lapses anyone may claim the job, and the old
+    worker can no longer renew or finish it.
+    """
+
+    @abstractmethod
+    def ensure_indexes(self):
+        pass
+
+    @abstractmethod
+    def put(self, job: Dict):
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float, exclude_users: Iterable[int],
+              max_priority: Optional[int] = None) -> Optional[Dict]:
+        """Atomically lease the next queued or abandoned job, skipping the given users"""
+        pass
+
+    @abstractmethod
+    def renew(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Extend a lease; False means the job is no longer ours"""
+        pass
+
+    @abstractmethod
+    def finish(self, job_id: str, worker_id: str, error: Optional[str] = None) -> bool:
+        pass
+
+    @abstractmethod
+    def release(self, job_id: str, worker_id: str):
+        """Hand a job back to the queue without counting the attempt"""
+        pass
+
+    @abstractmethod
+    def set_progress(self, job_id: str, worker_id: str, progress: str) -> bool:
+        """Record how far a job got; False means the job is no longer ours"""
+        pass
+
+    @abstractmethod
+    def fail_abandoned(self, max_attempts: int) -> int:
+        """Fail expired jobs that have used up their attempts"""
+        pass
+
+    @abstractmethod
+    def running_counts(self) -> Counter:
+        """Running jobs per user, across every scheduler sharing the store"""
+        pass
+
+    @abstractmethod
+    def position(self, job: Dict) -> int:
+        """1-based place of a queued job in priority order"""
+        pass
+
+
+class MongoJobStore(JobStore):
+    """Job store on a MongoDB collection, shared by every bot and worker process"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def ensure_indexes(self):
+        self.collection.create_index([('status', ASCENDING), ('priority', ASCENDING), ('created_at', ASCENDING)])
+        self.collection.create_index([('status', ASCENDING), ('lease_until', ASCENDING)])
+        self.collection.create_index('expires_at', expireAfterSeconds=0)
+
+    def put(self, job: Dict):
+        self.collection.insert_one(job)
+
+    def claim(self, worker_id: str, lease_seconds: float, exclude_users: Iterable[int],
+              max_priority: Optional[int] = None) -> Optional[Dict]:
+        now = time.time()
+        query = {'$or': [
+            {'status': 'queued'},
+            {'status': 'running', 'lease_until': {'$lt': now}, 'attempts': {'$lt': MAX_ATTEMPTS}},
+        ]}
+        exclude_users = list(exclude_users)
+        if exclude_users:
+            query['user_id'] = {'$nin': exclude_users}
+        if max_priority is not None:
+            query['priority'] = {'$lt': max_priority}
+        return self.collection.find_one_and_update(
+            query,
+            {'$set': {'status': 'running', 'worker': worker_id, 'started_at': now,
+                      'lease_until': now + lease_seconds},
+             '$inc': {'attempts': 1}},
+            sort=[('priority', ASCENDING), ('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def renew(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        result = self.collection.update_one(
+            {'_id': job_id, 'status': 'running', 'worker': worker_id},
+            {'$set': {'lease_until': time.time() + lease_seconds}}
+        )
+        return result.matched_count == 1
+
+    def finish(self, job_id: str, worker_id: str, error: Optional[str] = None) -> bool:
+        result = self.collection.update_one({'_id': job_id, 'status': 'running', 'worker': worker_id}, {'$set': {
+            'status': 'failed' if error else 'done',
+            'error': error,
+            'finished_at': time.time(),
+            'lease_until': None,
+            'expires_at': datetime.utcnow() + timedelta(seconds=HISTORY_SECONDS),
+        }})
+        return result.matched_count == 1
+
+    def release(self, job_id: str, worker_id: str):
+        self.collection.update_one(
+            {'_id': job_id, 'status': 'running', 'worker': worker_id},
+            {'$set': {'status': 'queued', 'worker': None, 'lease_until': None}, '$inc': {'attempts': -1}}
+        )
+
+    def set_progress(self, job_id: str, worker_id: str, progress: str) -> bool:
+        result = self.collection.update_one(
+            {'_id': job_id, 'status': 'running', 'worker': worker_id},
+            {'$set': {'progress': progress}}
+        )
+        return result.matched_count == 1
+
+    def fail_abandoned(self, max_attempts: int) -> int:
+        result = self.collection.update_many(
+            {'status': 'running', 'lease_until': {'$lt': time.time()}, 'attempts': {'$gte': max_attempts}},
+            {'$set': {'status': 'failed', 'error': "Worker stopped responding too many times",
+                      'finished_at': time.time(),
+                      'expires_at': datetime.utcnow() + timedelta(seconds=HISTORY_SECONDS)}}
+        )
+        return result.modified_count
+
+    def running_counts(self) -> Counter:
+        users = Counter()
+        live = {'status': 'running', 'lease_until': {'$gte': time.time()}}
+        for job in self.collection.find(live, {'user_id': 1}):
+            users[job['user_id']] += 1
+        return users
+
+    def position(self, job: Dict) -> int:
+        ahead = self.collection.count_documents({'status': 'queued', '$or': [
+            {'priority': {'$lt': job['priority']}},
+            {'priority': job['priority'], 'created_at': {'$lt': job['created_at']}},
+        ]})
+        return ahead + 1
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store in a local SQLite file, for running without MongoDB
+    Worker processes on the same machine may share the file
+    """
+
+    COLUMNS = ['_id', 'kind', 'user_id', 'chat_id', 'message_id', 'payload', 'priority', 'status',
+               'created_at', 'started_at', 'finished_at', 'error', 'attempts', 'worker', 'lease_until',
+               'progress']
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("JOB_SQLITE_PATH", DEFAULT_SQLITE_PATH)
+        # Autocommit mode; claims take an explicit write lock
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params: Iterable = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).fetchall()
+
+    def _update(self, sql: str, params: Iterable = ()) -> int:
+        with self._lock:
+            return self._conn.execute(sql, tuple(params)).rowcount
+
+    def _to_job(self, row: tuple) -> Dict:
+        job = dict(zip(self.COLUMNS, row))
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def ensure_indexes(self):
+        self._execute("PRAGMA journal_mode=WAL")
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS jobs (_id TEXT PRIMARY KEY, kind TEXT, user_id INTEGER, "
+            "chat_id INTEGER, message_id INTEGER, payload TEXT, priority INTEGER, status TEXT, "
+            "created_at REAL, started_at REAL, finished_at REAL, error TEXT, "
+            "attempts INTEGER DEFAULT 0, worker TEXT, lease_until REAL, progress TEXT)"
+        )
+        # Files created before leases and progress markers existed
+        existing = {row[1] for row in self._execute("PRAGMA table_info(jobs)")}
+        for column, column_type in (('lease_until', 'REAL'), ('progress', 'TEXT')):
+            if column not in existing:
+                self._execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, created_at)")
+
+    def put(self, job: Dict):
+        row = dict(job, payload=json.dumps(job['payload']))
+        self._execute(
+            f"INSERT INTO jobs ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})",
+            [row.get(column) for column in self.COLUMNS]
+        )
+
+    def claim(self, worker_id: str, lease_seconds: float, exclude_users: Iterable[int],
+              max_priority: Optional[int] = None) -> Optional[Dict]:
+        now = time.time()
+        exclude_users = list(exclude_users)
+        sql = (f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE (status = 'queued' OR "
+               f"(status = 'running' AND lease_until < ? AND attempts < ?))")
+        params: List = [now, MAX_ATTEMPTS]
+        if exclude_users:
+            sql += f" AND user_id NOT IN ({', '.join('?' * len(exclude_users))})"
+            params += exclude_users
+        if max_priority is not None:
+            sql += " AND priority < ?"
+            params.append(max_priority)
+        sql += " ORDER BY priority, created_at LIMIT 1"
+
+        with self._lock:
+            # BEGIN IMMEDIATE also serializes claims from other processes on the same file
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(sql, params).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                job = self._to_job(row)
+                job.update(status='running', worker=worker_id, started_at=now,
+                           lease_until=now + lease_seconds, attempts=(job['attempts'] or 0) + 1)
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, worker = ?, started_at = ?, lease_until = ?, attempts = ? "
+                    "WHERE _id = ?",
+                    (job['status'], worker_id, now, job['lease_until'], job['attempts'], job['_id'])
+                )
+                self._conn.execute("COMMIT")
+                return job
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def renew(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        return self._update(
+            "UPDATE jobs SET lease_until = ? WHERE _id = ? AND status = 'running' AND worker = ?",
+            (time.time() + lease_seconds, job_id, worker_id)
+        ) == 1
+
+    def finish(self, job_id: str, worker_id: str, error: Optional[str] = None) -> bool:
+        now = time.time()
+        updated = self._update(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL "
+            "WHERE _id = ? AND status = 'running' AND worker = ?",
+            ('failed' if error else 'done', error, now, job_id, worker_id)
+        )
+        self._update(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (now - HISTORY_SECONDS,)
+        )
+        return updated == 1
+
+    def release(self, job_id: str, worker_id: str):
+        self._update(
+            "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, attempts = attempts - 1 "
+            "WHERE _id = ? AND status = 'running' AND worker = ?",
+            (job_id, worker_id)
+        )
+
+    def set_progress(self, job_id: str, worker_id: str, progress: str) -> bool:
+        return self._update(
+            "UPDATE jobs SET progress = ? WHERE _id = ? AND status = 'running' AND worker = ?",
+            (progress, job_id, worker_id)
+        ) == 1
+
+    def fail_abandoned(self, max_attempts: int) -> int:
+        now = time.time()
+        return self._update(
+            "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding too many times', "
+            "finished_at = ? WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+            (now, now, max_attempts)
+        )
+
+    def running_counts(self) -> Counter:
+        rows = self._execute(
+            "SELECT user_id FROM jobs WHERE status = 'running' AND lease_until >= ?", (time.time(),)
+        )
+        return Counter(user_id for user_id, in rows)
+
+    def position(self, job: Dict) -> int:
+        ahead = self._execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+            "(priority < ? OR (priority = ? AND created_at < ?))",
+            (job['priority'], job['priority'], job['created_at'])
+        )[0][0]
+        return ahead + 1
+
+
+class JobScheduler:
+    """
+    Runs persisted jobs on a fixed number of worker slots
+
+    Single links (PRIORITY_SINGLE) are claimed before bulk portals, and bulk
+    jobs may occupy at most `bulk_slots` of this scheduler's slots so small
+    requests always find room; the cap grows with the number of workers.
+    Within a priority, users with nothing running go first and nobody
+    holds more than `per_user` slots.
+
+    Any number of schedulers, in one process or on many machines, may share
+    a store. Claimed jobs are leased and the lease is renewed while they run.
+    A crashed worker's jobs are taken over once their lease lapses, and a
+    worker that loses a lease stops the job instead of racing the new owner.
+    With workers=0 the scheduler only submits and leaves execution to others.
+
+    Handlers call mark_progress(job, 'sending') before delivering anything
+    and 'sent' afterwards. A job taken over once sending began is not run
+    again, since the old worker may already have delivered it; it is failed
+    and `on_interrupted` is told, so a result is sent at most once.
+    """
+
+    def __init__(self, store: JobStore, handlers: Dict[str, Callable[[Dict], Awaitable[None]]],
+                 workers: Optional[int] = None, per_user: Optional[int] = None,
+                 bulk_slots: Optional[int] = None, poll_interval: Optional[float] = None,
+                 lease_seconds: Optional[float] = None,
+                 on_interrupted: Optional[Callable[[Dict], Awaitable[None]]] = None):
+        self.store = store
+        self.handlers = handlers
+        self.on_interrupted = on_interrupted
+        self.workers = workers if workers is not None else int(os.getenv("JOB_WORKERS", DEFAULT_WORKERS))
+        self.per_user = per_user or int(os.getenv("JOB_USER_LIMIT", DEFAULT_USER_LIMIT))
+        self.bulk_slots = bulk_slots or int(os.getenv("JOB_BULK_SLOTS", 0)) or max(1, self.workers // 2)
+        self.poll_interval = poll_interval or float(os.getenv("JOB_POLL_INTERVAL", DEFAULT_POLL_INTERVAL))
+        self.lease_seconds = lease_seconds or float(os.getenv("JOB_LEASE_SECONDS", DEFAULT_LEASE_SECONDS))
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Dict[str, asyncio.Task] = {}
+        # Running jobs of ours that count against bulk_slots
+        self._running_bulk: Set[str] = set()
+        # Local copy of each lease's deadline, so a worker cut off from the store stops in time
+        self._lease_deadlines: Dict[str, float] = {}
+        self._lost: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    @property
+    def idle_slots(self) -> int:
+        return self.workers - len(self._running)
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: fn(*args))
+
+    async def start(self):
+        """Prepare the store and start dispatching"""
+        await self._run(self.store.ensure_indexes)
+        self._wakeup = asyncio.Event()
+        if self.workers > 0:
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+            self._heartbeat = asyncio.ensure_future(self._renew_leases())
+
+    async def stop(self):
+        """Stop dispatching, cancel running jobs and hand them back to the queue"""
+        for task in (self._dispatcher, self._heartbeat):
+            if task is not None:
+                task.cancel()
+        self._dispatcher = self._heartbeat = None
+
+        job_ids = list(self._running)
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job_id in job_ids:
+            try:
+                await self._run(self.store.release, job_id, self.worker_id)
+            except Exception as e:
+                # The lease runs out on its own and another worker takes over
+                logger.warning(f"Could not release job {job_id}: {str(e)}")
+
+    async def submit(self, kind: str, user_id: int, chat_id: int, message_id: int,
+                     payload: Dict, priority: int = PRIORITY_SINGLE) -> int:
+        """Persist a job and return its position in the queue"""
+        job = {
+            '_id': uuid.uuid4().hex,
+            'kind': kind,
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'payload': payload,
+            'priority': priority,
+            'status': 'queued',
+            'created_at': time.time(),
+            'attempts': 0,
+        }
+        await self._run(self.store.put, job)
+        position = await self._run(self.store.position, job)
+        self._wakeup.set()
+        return position
+
+    async def mark_progress(self, job: Dict, progress: str):
+        """
+        Record how far a job got. Marking 'sending' raises when it can't be
+        recorded, so nothing goes out twice; later markers are best effort,
+        at worst a takeover warns the user about an interrupted send
+        """
+        try:
+            marked = await self._run(self.store.set_progress, job['_id'], self.worker_id, progress)
+        except Exception as e:
+            if progress == 'sending':
+                raise
+            logger.warning(f"Could not mark job {job['_id']} as {progress}: {str(e)}")
+            return
+        if not marked:
+            if progress == 'sending':
+                raise Exception("This request was taken over by another worker")
+            logger.warning(f"Job {job['_id']} was taken over before it was marked as {progress}")
+        job['progress'] = progress
+
+    def _claim_next(self) -> Optional[Dict]:
+        """Pick the next job by priority, then fair share (blocking)"""
+        users = self.store.running_counts()
+        bulk = len(self._running_bulk)
+        saturated = [user_id for user_id, count in users.items() if count >= self.per_user]
+        exclusions = [list(users)]
+        if len(saturated) < len(users):
+            exclusions.append(saturated)
+
+        # Single links first, then bulk jobs while bulk slots remain
+        for max_priority in (PRIORITY_BULK, None):
+            if max_priority is None and bulk >= self.bulk_slots:
+                break
+            for exclude in exclusions:
+                job = self.store.claim(self.worker_id, self.lease_seconds, exclude, max_priority)
+                if job:
+                    return job
+        return None
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                failed = await self._run(self.store.fail_abandoned, MAX_ATTEMPTS)
+                if failed:
+                    logger.warning(f"Gave up on {failed} jobs whose workers kept dying")
+            except Exception as e:
+                logger.error(f"Failed to check for abandoned jobs: {str(e)}")
+
+            while len(self._running) < self.workers:
+                try:
+                    job = await self._run(self._claim_next)
+                except Exception as e:
+                    logger.error(f"Failed to claim a job: {str(e)}")
+                    job = None
+                if job is None:
+                    break
+                if job['attempts'] > 1:
+                    logger.info(f"Took over job {job['_id']} (attempt {job['attempts']})")
+                self._lease_deadlines[job['_id']] = time.monotonic() + self.lease_seconds
+                if job['priority'] >= PRIORITY_BULK:
+                    self._running_bulk.add(job['_id'])
+                self._running[job['_id']] = asyncio.ensure_future(self._execute(job))
+            # Jobs submitted by other processes are picked up on the next poll
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            for job_id, task in list(self._running.items()):
+                try:
+                    renewed = await self._run(self.store.renew, job_id, self.worker_id, self.lease_seconds)
+                except Exception as e:
+                    logger.warning(f"Could not renew the lease on job {job_id}: {str(e)}")
+                    renewed = None
+                if renewed:
+                    self._lease_deadlines[job_id] = time.monotonic() + self.lease_seconds
+                # An unreachable store is tolerated until the lease we hold runs out
+                elif renewed is False or time.monotonic() >= self._lease_deadlines.get(job_id, 0):
+                    logger.warning(f"Lost the lease on job {job_id}, stopping it")
+                    self._lost.add(job_id)
+                    task.cancel()
+
+    async def _execute(self, job: Dict):
+        # Pool work spawned by this job inherits its priority
+        job_priority.set(job['priority'])
+        error = None
+        try:
+            handler = self.handlers.get(job['kind'])
+            if handler is None:
+                raise Exception(f"Unknown job kind: {job['kind']}")
+            if job.get('progress') == 'sending':
+                error = "Interrupted while sending; not sent again in case it arrived"
+                logger.warning(f"Job {job['_id']} was taken over while sending, not repeating it")
+                if self.on_interrupted is not None:
+                    await self.on_interrupted(job)
+            elif job.get('progress') != 'sent':
+                await handler(job)
+        except asyncio.CancelledError:
+            self._running.pop(job['_id'], None)
+            self._running_bulk.discard(job['_id'])
+            self._lease_deadlines.pop(job['_id'], None)
+            if job['_id'] in self._lost:
+                # Another worker owns the job now; nothing to record
+                self._lost.discard(job['_id'])
+                self._wakeup.set()
+                return
+            raise
+        except Exception as e:
+            logger.error(f"Job {job['_id']} ({job['kind']}) failed: {str(e)}", exc_info=True)
+            error = str(e) or type(e).__name__
+
+        self._running.pop(job['_id'], None)
+        self._running_bulk.discard(job['_id'])
+        self._lease_deadlines.pop(job['_id'], None)
+        try:
+            if not await self._run(self.store.finish, job['_id'], self.worker_id, error):
+                logger.warning(f"Job {job['_id']} finished after another worker took it over")
+        except Exception as e:
+            logger.error(f"Failed to record job {job['_id']}: {str(e)}")
+        self._wakeup.set()
+
+
+def create_job_store(db=None) -> JobStore:
+    """Job store selected by JOB_STORE: "mongodb" (default) or "sqlite" """
+    if os.getenv("JOB_STORE", "mongodb").lower() == "sqlite":
+        return SQLiteJobStore()
+    return MongoJobStore(db.db.jobs)
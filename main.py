@@ -1,20 +1,22 @@
-from datetime import datetime  # यह नई लाइन जोड़ें
-from pymongo import MongoClient
 #from config import Config
 import os
 import re
+import asyncio
 import logging
-from typing import List, Dict, Optional
-from pathlib import Path
-from jinja2 import Template
-from pyrogram import Client, filters
+from typing import Callable, List, Dict, Optional
+from pyrogram import Client, filters, idle
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from dotenv import load_dotenv
-from .extractors import get_extractor
-from utilities.database import MongoDB
-from utilities.drm_utils import apply_drm
-from utilities.file_utils import process_text_file, clean_temp_files, download_file
-from utilities.html_generator import generate_html_portal
+from extractors import get_extractor
+from utilities.worker_pool import shutdown_pools
+from utilities.url_utils import normalize_url
+from utilities.pipeline import StagedPipeline
+from utilities.env_utils import parse_overrides
+from utilities.scratch import ScratchDir, ScratchFlight, adopt, link_into
+
+# Heavy dependencies (pymongo, yt-dlp, jinja2, cryptography, aiohttp) are
+# imported inside the handlers that use them so the bot answers sooner after
+# a cold start.
 
 # Load environment variables
 load_dotenv()
@@ -26,283 +28,283 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize MongoDB
-db = MongoDB(os.getenv("MONGODB_URI"))
+# Identical links requested at the same time are processed once
+content_flight = ScratchFlight("content pipeline")
+drm_flight = ScratchFlight("DRM protection")
+
+# Workers per content pipeline stage, overridable with PIPELINE_WORKERS
+PIPELINE_STAGE_WORKERS = {'extract': 8, 'download': 4, 'drm': os.cpu_count() or 1, 'upload': 2}
+# Portal items stop before upload; their files are linked from the portal
+PREPARE_STAGES = ('extract', 'download', 'drm')
+
+# Admins are always authorized and may manage other users
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(' ', '').split(',') if x}
+
+# MongoDB, the authorization cache, the content pipeline and the job scheduler are set up by
+# start_services(), which runs while the Telegram client connects; handlers
+# wait on services_ready
+db = None
+auth_cache = None
+scheduler = None
+pipeline: Optional[StagedPipeline] = None
+upload_engine = None
+services_ready: Optional[asyncio.Event] = None
+
+# BOT_MODE=worker only processes queued jobs: it gets no Telegram updates and
+# adds download/DRM/upload capacity alongside the bot (see worker.py)
+WORKER_MODE = os.getenv("BOT_MODE", "bot") == "worker"
 
 # Create Pyrogram client
 app = Client(
-    "drm_uploader_bot",
+    "drm_uploader_worker" if WORKER_MODE else "drm_uploader_bot",
     api_id=os.getenv("API_ID"),
     api_hash=os.getenv("API_HASH"),
-    bot_token=os.getenv("BOT_TOKEN")
+    bot_token=os.getenv("BOT_TOKEN"),
+    # Workers sign in with the bot token on every start, so several can run side by side
+    in_memory=WORKER_MODE,
+    no_updates=WORKER_MODE
 )
 
-# HTML template for the portal
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Course Portal - {{title}}</title>
-    <style>
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            line-height: 1.6;
-            margin: 0;
-            padding: 0;
-            background-color: #f5f5f5;
-            color: #333;
-        }
-        .container {
-            max-width: 1200px;
-            margin: 0 auto;
-            padding: 20px;
-        }
-        header {
-            background: linear-gradient(135deg, #6e48aa 0%, #9d50bb 100%);
-            color: white;
-            padding: 20px 0;
-            text-align: center;
-            border-radius: 0 0 10px 10px;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-            margin-bottom: 30px;
-        }
-        h1 {
-            margin: 0;
-            font-size: 2.2em;
-        }
-        .search-box {
-            margin: 20px 0;
-            text-align: center;
-        }
-        #searchInput {
-            padding: 10px 15px;
-            width: 70%;
-            border: 1px solid #ddd;
-            border-radius: 25px;
-            font-size: 16px;
-            outline: none;
-        }
-        .content-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(300px, 1fr));
-            gap: 20px;
-            margin-top: 20px;
-        }
-        .content-card {
-            background: white;
-            border-radius: 8px;
-            overflow: hidden;
-            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
-            transition: transform 0.3s ease;
-        }
-        .content-card:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 5px 15px rgba(0, 0, 0, 0.2);
-        }
-        .card-image {
-            height: 180px;
-            overflow: hidden;
-        }
-        .card-image img {
-            width: 100%;
-            height: 100%;
-            object-fit: cover;
-        }
-        .card-body {
-            padding: 15px;
-        }
-        .card-title {
-            font-size: 1.2em;
-            margin: 0 0 10px 0;
-            color: #333;
-        }
-        .card-meta {
-            font-size: 0.9em;
-            color: #666;
-            margin-bottom: 15px;
-        }
-        .quality-selector {
-            margin-bottom: 10px;
-        }
-        select {
-            padding: 5px;
-            border-radius: 4px;
-            border: 1px solid #ddd;
-        }
-        .download-btn {
-            display: inline-block;
-            background: linear-gradient(135deg, #6e48aa 0%, #9d50bb 100%);
-            color: white;
-            padding: 8px 15px;
-            text-decoration: none;
-            border-radius: 4px;
-            font-weight: bold;
-            transition: background 0.3s ease;
-        }
-        .download-btn:hover {
-            background: linear-gradient(135deg, #5d3a99 0%, #8c40ab 100%);
-        }
-        .no-results {
-            text-align: center;
-            grid-column: 1 / -1;
-            padding: 40px;
-            color: #666;
-        }
-        footer {
-            text-align: center;
-            margin-top: 40px;
-            padding: 20px;
-            color: #666;
-            font-size: 0.9em;
-        }
-        @media (max-width: 768px) {
-            .content-grid {
-                grid-template-columns: 1fr;
-            }
-            #searchInput {
-                width: 90%;
-            }
-        }
-    </style>
-</head>
-<body>
-    <header>
-        <div class="container">
-            <h1>{{title}}</h1>
-            <p>Access all your course materials in one place</p>
-        </div>
-    </header>
-
-    <div class="container">
-        <div class="search-box">
-            <input type="text" id="searchInput" placeholder="Search for videos, PDFs..." onkeyup="searchContent()">
-        </div>
-
-        <div class="content-grid" id="contentGrid">
-            {% for item in content_items %}
-            <div class="content-card" data-title="{{item.title|lower}}" data-type="{{item.type}}">
-                <div class="card-image">
-                    <img src="{{item.thumbnail or 'https://via.placeholder.com/300x180?text=No+Thumbnail'}}" alt="{{item.title}}">
-                </div>
-                <div class="card-body">
-                    <h3 class="card-title">{{item.title}}</h3>
-                    <div class="card-meta">
-                        <span>{{item.type|upper}}</span> • 
-                        <span>{{item.duration|default('N/A')}}</span>
-                    </div>
-                    
-                    {% if item.type == 'video' %}
-                    <div class="quality-selector">
-                        <select id="quality-{{loop.index}}">
-                            {% for quality in item.qualities %}
-                            <option value="{{quality.url}}">{{quality.resolution}} ({{quality.size}})</option>
-                            {% endfor %}
-                        </select>
-                    </div>
-                    {% endif %}
-                    
-                    <a href="{{item.download_url}}" class="download-btn" download>
-                        Download {{item.type|upper}}
-                    </a>
-                </div>
-            </div>
-            {% else %}
-            <div class="no-results">
-                <p>No content available yet. Please check back later.</p>
-            </div>
-            {% endfor %}
-        </div>
-    </div>
-
-    <footer>
-        <div class="container">
-            <p>Generated by DRM Uploader Bot • {{timestamp}}</p>
-        </div>
-    </footer>
-
-    <script>
-        function searchContent() {
-            const input = document.getElementById('searchInput');
-            const filter = input.value.toLowerCase();
-            const grid = document.getElementById('contentGrid');
-            const cards = grid.getElementsByClassName('content-card');
-
-            for (let i = 0; i < cards.length; i++) {
-                const title = cards[i].getAttribute('data-title');
-                const type = cards[i].getAttribute('data-type');
-                
-                if (title.includes(filter) || type.includes(filter)) {
-                    cards[i].style.display = "";
-                } else {
-                    cards[i].style.display = "none";
-                }
-            }
-        }
-    </script>
-</body>
-</html>
-"""
+async def extract_content(content_url: str) -> Dict:
+    """Extract content info with the extractor for the URL's platform"""
+    extractor = get_extractor(content_url)
+    if not extractor:
+        raise Exception("Unsupported link/platform")
+    return await extractor.extract(content_url)
 
-async def generate_html_portal(title: str, content_items: List[Dict]) -> str:
-    """Generate HTML portal from content items"""
-    from datetime import datetime
-    
-    # Prepare template data
-    template_data = {
-        'title': title,
-        'content_items': content_items,
-        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    
-    # Create HTML from template
-    template = Template(HTML_TEMPLATE)
-    html_content = template.render(template_data)
-    
-    # Save to file
-    output_file = f"course_portal_{int(datetime.now().timestamp())}.html"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    
-    return output_file
+async def prepare_content(content_url: str, status=None) -> Dict:
+    """
+    Extract, download and protect content from URL
+    `status` is an optional coroutine function used to report each step,
+    usually a ProgressReporter, which also gets download progress
+    Requests for a link that is already being processed share that run
+    """
+    key = normalize_url(content_url)
+    if content_flight.in_flight(key) and status:
+        await status("⏳ This link is already being processed, sharing the result...")
+    return await content_flight.do(key, lambda: _prepare_content(content_url, status), _relink_file)
+
+def _relink_file(content_info: Dict, directory: str) -> Dict:
+    """Copy of a shared result with its file linked into one requester's directory"""
+    content_info = dict(content_info)
+    if content_info.get('file_path'):
+        content_info['file_path'] = link_into(content_info['file_path'], directory)
+    return content_info
+
+async def _prepare_content(content_url: str, status=None) -> Dict:
+    work = await pipeline.submit({'url': content_url, 'status': status}, route=PREPARE_STAGES)
+    return work['info']
+
+async def _report(work: Dict, text: str):
+    if work.get('status'):
+        # Other requests may be sharing this run, so a failed edit mustn't abort it
+        try:
+            await work['status'](text)
+        except Exception as e:
+            logger.warning(f"Status update failed: {str(e)}")
+
+def _transfer(work: Dict, label: str):
+    """Byte progress callback for the work's status reporter, if it takes one"""
+    reporter = work.get('status')
+    return reporter.transfer(label) if hasattr(reporter, 'transfer') else None
+
+async def _extract_stage(work: Dict) -> Dict:
+    work['info'] = await extract_content(work['url'])
+    await _report(work, f"✅ Extracted: {work['info']['title']}")
+    return work
+
+async def _download_stage(work: Dict) -> Dict:
+    """Download content, reusing a cached copy when the origin file is unchanged"""
+    from utilities.file_utils import download_file
+    from utilities.download_cache import get_download_cache
+    from utilities.drm_utils import download_protected, streams_protected
+    from utilities.scratch import current_scratch, expected_size, get_disk_budget
+
+    content_info = work['info']
+    await _report(work, "📥 Downloading content...")
+    progress = _transfer(work, "📥 Downloading")
+    # With DRM_STREAMING=1 direct videos are encrypted while they download
+    if streams_protected(content_info):
+        reservation = await get_disk_budget().reserve(await expected_size(content_info))
+        protected = await download_protected(content_info, progress)
+        if protected:
+            content_info['file_path'] = protected
+            return work
+        current_scratch.get().release(reservation)
+
+    source_url = content_info.get('preferred_quality') or content_info['download_url']
+
+    async def download() -> str:
+        # Only on a cache miss; every job the file is linked into holds the space
+        await get_disk_budget().reserve(await expected_size(content_info))
+        return await download_file(content_info['download_url'], content_info['type'], quality=source_url,
+                                   progress=progress)
 
-async def process_content(message: Message, content_url: str) -> Optional[Dict]:
-    """Process content from URL and return info dict"""
+    content_info['file_path'] = await get_download_cache().fetch(source_url, download)
+    return work
+
+async def _drm_stage(work: Dict) -> Dict:
+    """Apply DRM if video"""
+    from utilities.scratch import current_scratch
+
+    content_info = work['info']
+    if content_info['type'] == 'video' and not content_info.get('drm_key'):
+        await _report(work, "🔒 Applying DRM protection...")
+        scratch = current_scratch.get()
+        plaintext = content_info['file_path']
+        # So far the run only holds space for the download, which stays
+        # counted until encryption is done
+        held = list(scratch.reservations)
+        # Links resolving to the same download share one protected copy; the
+        # key is the download's, since every job holds its own copy of the file
+        source_url = content_info.get('preferred_quality') or content_info['download_url']
+        content_info.update(await drm_flight.do(normalize_url(source_url), lambda: _protect(dict(content_info)),
+                                                _relink_file))
+        os.remove(plaintext)
+        for reservation in held:
+            scratch.release(reservation)
+    return work
+
+async def _protect(content_info: Dict) -> Dict:
+    from utilities.drm_utils import apply_drm
+    from utilities.scratch import get_disk_budget
+
+    # Encrypt in the flight's own directory; the input is counted by the
+    # requester until this returns, the output by this reservation
+    content_info['file_path'] = adopt(content_info['file_path'])
+    await get_disk_budget().reserve(os.path.getsize(content_info['file_path']))
+    file_path = await apply_drm(content_info)
+    return {'file_path': file_path, 'drm_key': content_info.get('drm_key')}
+
+async def _upload_stage(work: Dict) -> Dict:
+    work['sent'] = await send_content(work['chat_id'], work['reply_to'], work['info'], work['media'],
+                                      work.get('progress'))
+    return work
+
+async def send_content(chat_id: int, reply_to: int, content_info: Dict, media: str,
+                       progress=None) -> List[Message]:
+    """
+    Send content from a local file or a Telegram file_id
+    Files over Telegram's size limit are sent as numbered parts
+    `progress` is an optional coroutine function taking (sent_bytes, total_bytes)
+    """
+    from utilities.uploader import split_file
+
+    if os.path.isfile(media):
+        parts = split_file(media)
+        if len(parts) > 1:
+            return await send_parts(chat_id, reply_to, content_info, parts, progress)
+        parts[0].close()
+
+    if content_info['type'] == 'video':
+        return [await app.send_video(
+            chat_id,
+            video=media,
+            caption=f"📹 {content_info['title']}",
+            duration=content_info.get('duration', 0),
+            thumb=content_info.get('thumbnail'),
+            reply_to_message_id=reply_to,
+            progress=progress
+        )]
+    return [await app.send_document(
+        chat_id,
+        document=media,
+        caption=f"📄 {content_info['title']}",
+        reply_to_message_id=reply_to,
+        progress=progress
+    )]
+
+async def send_parts(chat_id: int, reply_to: int, content_info: Dict, parts: List, progress=None) -> List[Message]:
+    """Send byte ranges of an oversized file as documents that join back into it"""
+    sent = []
     try:
-        msg = await message.reply_text("🔍 Analyzing link...")
-        
-        # Get appropriate extractor
-        extractor = get_extractor(content_url)
-        if not extractor:
-            await msg.edit_text("❌ Unsupported link/platform")
-            return None
-        
-        # Extract content info
-        content_info = await extractor.extract(content_url)
-        await msg.edit_text(f"✅ Extracted: {content_info['title']}")
-        
-        # Download content
-        await msg.edit_text("📥 Downloading content...")
-        content_info['file_path'] = await download_file(
-            content_info['download_url'],
-            content_info['type'],
-            quality=content_info.get('preferred_quality')
-        )
-        
-        # Apply DRM if video
-        if content_info['type'] == 'video':
-            await msg.edit_text("🔒 Applying DRM protection...")
-            content_info['file_path'] = await apply_drm(content_info)
-        
-        return content_info
+        for number, part in enumerate(parts, start=1):
+            sent.append(await app.send_document(
+                chat_id,
+                document=part,
+                file_name=part.name,
+                caption=f"📦 {content_info['title']} (part {number}/{len(parts)})\n"
+                        f"Join the parts in order to restore the file",
+                reply_to_message_id=reply_to,
+                progress=progress
+            ))
+    finally:
+        for part in parts:
+            part.close()
+    return sent
+
+def upload_progress(reporter) -> Callable:
+    """Pyrogram upload progress callback that updates a ProgressReporter"""
+    on_progress = reporter.transfer("📤 Uploading")
+
+    # A coroutine function, so Pyrogram calls it on the event loop
+    async def progress(current: int, total: int):
+        on_progress(current, total)
+    return progress
+
+async def run_content_job(job: Dict):
+    """Extract, download and send a queued single link"""
+    async with ScratchDir(f"job-{job['_id']}"):
+        await _run_content_job(job)
+
+async def _run_content_job(job: Dict):
+    from utilities.file_id_cache import get_file_id_cache
+    from utilities.progress import ProgressReporter
+
+    chat_id, reply_to = job['chat_id'], job['message_id']
+    content_url = job['payload']['url']
+    file_ids = get_file_id_cache()
+    try:
+        msg = await app.send_message(chat_id, "🔍 Analyzing link...", reply_to_message_id=reply_to)
+        reporter = ProgressReporter(msg)
+
+        # Content uploaded before is resent by file_id without downloading it again
+        content_info = await extract_content(content_url)
+        cached, validators = await file_ids.lookup(content_url, content_info)
+        if cached:
+            try:
+                await scheduler.mark_progress(job, 'sending')
+                await send_content(chat_id, reply_to, content_info, cached['file_id'])
+                await scheduler.mark_progress(job, 'sent')
+                reporter.update(f"✅ {content_info['title']}")
+                await db.log_request(job['user_id'], content_info.get('platform', 'universal'), content_info['title'])
+                return
+            except Exception as e:
+                logger.warning(f"Cached file_id for {content_url} was rejected: {str(e)}")
+                await file_ids.invalidate(content_url, content_info)
+
+        content_info = await prepare_content(content_url, reporter)
+        await db.log_request(job['user_id'], content_info.get('platform', 'universal'), content_info['title'])
+
+        await scheduler.mark_progress(job, 'sending')
+        work = await pipeline.submit({
+            'chat_id': chat_id, 'reply_to': reply_to, 'info': content_info, 'media': content_info['file_path'],
+            'progress': upload_progress(reporter)
+        }, route=['upload'])
+        await scheduler.mark_progress(job, 'sent')
+        reporter.update(f"✅ {content_info['title']}")
+        # Files sent in parts can't be resent by a single file_id
+        if len(work['sent']) == 1:
+            await file_ids.remember(content_url, content_info, work['sent'][0], validators)
     
     except Exception as e:
         logger.error(f"Error processing content: {str(e)}", exc_info=True)
-        await message.reply_text(f"❌ Error processing content: {str(e)}")
-        return None
-    finally:
-        clean_temp_files()
+        await app.send_message(chat_id, f"❌ Error processing content: {str(e)}", reply_to_message_id=reply_to)
+        raise
+
+async def notify_interrupted(job: Dict):
+    """A worker died while sending this job's result; it isn't sent again in case it arrived"""
+    await app.send_message(job['chat_id'], "⚠️ Sending was interrupted. If nothing arrived, please send your request again.",
+                           reply_to_message_id=job['message_id'])
+
+async def enqueue(message: Message, kind: str, payload: Dict, priority: int):
+    """Queue a job for the message and tell the user where it stands"""
+    await services_ready.wait()
+    position = await scheduler.submit(
+        kind, message.from_user.id, message.chat.id, message.id, payload, priority
+    )
+    if position > 1 or not scheduler.idle_slots:
+        await message.reply_text(f"🕒 Queued at position {position}. I'll reply here when it's ready.")
 
 @app.on_message(filters.command("start"))
 async def start(client: Client, message: Message):
@@ -351,72 +353,150 @@ async def help_command(client: Client, message: Message):
 """
     await message.reply_text(help_text)
 
+@app.on_message(filters.command("stats"))
+async def stats_command(client: Client, message: Message):
+    """Show how many requests the user has made, plus bot-wide activity for admins"""
+    await services_ready.wait()
+    count = await db.get_user_stats(message.from_user.id)
+    text = f"📊 You have made {count} requests so far."
+    
+    if message.from_user.id in ADMIN_IDS:
+        summary = await db.get_activity_summary(days=7)
+        platforms = "\n".join(f"- {name}: {total}" for name, total in summary['platforms'].items())
+        days = "\n".join(f"- {day}: {total}" for day, total in summary['days'].items())
+        text += f"\n\n**Last 7 days by platform**\n{platforms or '- none'}\n\n**By day**\n{days or '- none'}"
+        text += f"\n\n**Pipeline (this process)**\n{pipeline.describe()}"
+        from utilities.scratch import get_disk_budget
+        disk = get_disk_budget().stats()
+        text += (f"\nScratch space: {disk['reserved'] / 2 ** 20:.0f} of {disk['budget'] / 2 ** 20:.0f} MB reserved, "
+                 f"{disk['waiting']} waiting")
+        text += f"\nLarge uploads: {upload_engine.throughput():.1f} MB/s on average"
+    
+    await message.reply_text(text)
+
+async def _set_authorization(message: Message, authorized: bool):
+    """Shared body of /adduser and /removeuser"""
+    if message.from_user.id not in ADMIN_IDS:
+        await message.reply_text("❌ Only admins can use this command.")
+        return
+    if len(message.command) < 2 or not message.command[1].lstrip('-').isdigit():
+        await message.reply_text(f"Usage: /{message.command[0]} <user_id>")
+        return
+    
+    user_id = int(message.command[1])
+    await services_ready.wait()
+    await db.set_user_authorized(user_id, authorized)
+    auth_cache.set_authorized(user_id, authorized)
+    if authorized:
+        await message.reply_text(f"✅ User {user_id} authorized.")
+    else:
+        await message.reply_text(f"✅ User {user_id} removed.")
+
+@app.on_message(filters.command("adduser"))
+async def add_user_command(client: Client, message: Message):
+    await _set_authorization(message, True)
+
+@app.on_message(filters.command("removeuser"))
+async def remove_user_command(client: Client, message: Message):
+    await _set_authorization(message, False)
+
 @app.on_message(filters.command("portal"))
 async def create_portal(client: Client, message: Message):
-    """Create HTML portal from text file"""
-    if not message.reply_to_message or not message.reply_to_message.document:
+    """Queue an HTML portal build from a text file"""
+    from utilities.job_queue import PRIORITY_BULK
+
+    document = message.document or (message.reply_to_message and message.reply_to_message.document)
+    if not document:
         await message.reply_text("❌ Please reply to a text file with /portal")
         return
     
+    await enqueue(message, 'portal', {'file_id': document.file_id}, PRIORITY_BULK)
+
+async def run_portal_job(job: Dict):
+    """Build and send an HTML portal from a queued text file"""
+    async with ScratchDir(f"job-{job['_id']}") as scratch:
+        await _run_portal_job(job, scratch)
+
+async def prepare_portal_item(content_url: str) -> Dict:
+    """Portal items only contribute metadata, so their files go as soon as they are done"""
+    async with ScratchDir("item"):
+        return await prepare_content(content_url)
+
+async def _run_portal_job(job: Dict, scratch: ScratchDir):
+    from utilities.file_utils import iter_links
+    from utilities.html_generator import generate_html_portal
+    from utilities.portal_builder import PortalBuilder
+    from utilities.progress import ProgressReporter
+
+    chat_id, reply_to = job['chat_id'], job['message_id']
     try:
-        msg = await message.reply_text("📥 Downloading text file...")
-        file_path = await message.reply_to_message.download()
+        msg = await app.send_message(chat_id, "📥 Downloading text file...", reply_to_message_id=reply_to)
+        reporter = ProgressReporter(msg)
+        file_path = await app.download_media(job['payload']['file_id'], file_name=os.path.abspath(scratch.path) + os.sep)
         
-        await msg.edit_text("🔍 Processing file content...")
-        links = await process_text_file(file_path)
+        reporter.update("🔍 Processing file content...")
+
+        async def on_progress(done: int, total: Optional[int], link: str, ok: bool):
+            # Coalesced by the reporter, so big portals don't run into FloodWait
+            reporter.update(f"🔄 Processed {done}/{total or '?'} links...")
+
+        # Links are processed as they are read from the file
+        builder = PortalBuilder(prepare_portal_item)
+        results = await builder.run(iter_links(file_path), on_progress=on_progress)
         
-        if not links:
-            await msg.edit_text("❌ No valid links found in file")
+        if not results:
+            reporter.update("❌ No valid links found in file")
             return
-            
-        await msg.edit_text(f"🔄 Found {len(links)} links. Processing content...")
         
         content_items = []
         success_count = 0
         
-        for link in links:
-            try:
-                content_info = await process_content(message, link)
-                if content_info:
-                    content_items.append({
-                        'title': content_info['title'],
-                        'type': content_info['type'],
-                        'thumbnail': content_info.get('thumbnail'),
-                        'duration': content_info.get('duration_formatted', 'N/A'),
-                        'download_url': content_info['file_path'],
-                        'qualities': content_info.get('qualities', [])
-                    })
-                    success_count += 1
-            except Exception as e:
-                logger.error(f"Error processing link {link}: {str(e)}")
-                await message.reply_text(f"⚠️ Skipped {link}: {str(e)}")
+        for link, content_info in results:
+            if isinstance(content_info, Exception):
+                await app.send_message(chat_id, f"⚠️ Skipped {link}: {str(content_info)}", reply_to_message_id=reply_to)
+                continue
+            await db.log_request(job['user_id'], content_info.get('platform', 'universal'), content_info['title'])
+            content_items.append({
+                'title': content_info['title'],
+                'type': content_info['type'],
+                'thumbnail': content_info.get('thumbnail'),
+                'duration': content_info.get('duration_formatted', 'N/A'),
+                'download_url': content_info['file_path'],
+                'qualities': content_info.get('qualities', [])
+            })
+            success_count += 1
         
         if not content_items:
-            await msg.edit_text("❌ No content could be processed")
+            reporter.update("❌ No content could be processed")
             return
         
-        await msg.edit_text("🛠 Generating HTML portal...")
+        reporter.update("🛠 Generating HTML portal...")
         portal_file = await generate_html_portal("My Course Portal", content_items)
         
-        await msg.edit_text("📤 Uploading portal...")
-        await message.reply_document(
+        reporter.update("📤 Uploading portal...")
+        await scheduler.mark_progress(job, 'sending')
+        await app.send_document(
+            chat_id,
             document=portal_file,
-            caption=f"🌐 Your Course Portal ({success_count}/{len(links)} items)"
+            caption=f"🌐 Your Course Portal ({success_count}/{len(results)} items)",
+            reply_to_message_id=reply_to,
+            progress=upload_progress(reporter)
         )
+        await scheduler.mark_progress(job, 'sent')
         
-        await msg.delete()
+        await reporter.delete()
         
     except Exception as e:
         logger.error(f"Portal creation error: {str(e)}", exc_info=True)
-        await message.reply_text(f"❌ Error creating portal: {str(e)}")
-    finally:
-        clean_temp_files()
+        await app.send_message(chat_id, f"❌ Error creating portal: {str(e)}", reply_to_message_id=reply_to)
+        raise
 
 @app.on_message(filters.text | filters.document)
 async def handle_content(client: Client, message: Message):
     """Handle all incoming content (text links and documents)"""
     user_id = message.from_user.id
-    if not db.is_user_authorized(user_id):
+    await services_ready.wait()
+    if not auth_cache.is_authorized(user_id):
         await message.reply_text("❌ You are not authorized to use this bot.")
         return
     
@@ -427,21 +507,76 @@ async def handle_content(client: Client, message: Message):
     
     text = message.text.strip()
     if re.match(r'https?://\S+', text):
-        content_info = await process_content(message, text)
-        if content_info:
-            if content_info['type'] == 'video':
-                await message.reply_video(
-                    video=content_info['file_path'],
-                    caption=f"📹 {content_info['title']}",
-                    duration=content_info.get('duration', 0),
-                    thumb=content_info.get('thumbnail')
-                )
-            else:
-                await message.reply_document(
-                    document=content_info['file_path'],
-                    caption=f"📄 {content_info['title']}"
-                )
+        from utilities.job_queue import PRIORITY_SINGLE
+        await enqueue(message, 'content', {'url': text}, PRIORITY_SINGLE)
+
+async def start_services():
+    """Connect to MongoDB, load the authorization cache and set up the pipeline, uploads and job queue"""
+    global db, auth_cache, scheduler, pipeline, upload_engine
+    from utilities.database import MongoDB
+    from utilities.auth_cache import AuthorizationCache
+    from utilities.extract_cache import get_extraction_cache
+    from utilities.file_id_cache import get_file_id_cache
+    from utilities.job_queue import JobScheduler, create_job_store
+    from utilities.scratch import remove_stale_scratch
+    from utilities.uploader import UploadEngine
+
+    remove_stale_scratch()
+    db = MongoDB(os.getenv("MONGODB_URI"))
+    await db.start()
+    await get_extraction_cache().attach_collection(db.db.extraction_cache)
+    get_file_id_cache().attach_collection(db.db.telegram_files)
+    if not WORKER_MODE:
+        auth_cache = AuthorizationCache(db, ADMIN_IDS)
+        await auth_cache.start()
+    workers = parse_overrides(os.getenv("PIPELINE_WORKERS"), PIPELINE_STAGE_WORKERS)
+    pipeline = StagedPipeline([
+        ('extract', _extract_stage, workers['extract']),
+        ('download', _download_stage, workers['download']),
+        ('drm', _drm_stage, workers['drm']),
+        ('upload', _upload_stage, workers['upload']),
+    ])
+    pipeline.start()
+    upload_engine = UploadEngine(app)
+    upload_engine.install()
+    scheduler = JobScheduler(create_job_store(db), {
+        'content': run_content_job,
+        'portal': run_portal_job,
+    }, on_interrupted=notify_interrupted)
+
+async def stop_services():
+    if scheduler is not None:
+        await scheduler.stop()
+    if pipeline is not None:
+        await pipeline.stop()
+    if upload_engine is not None:
+        await upload_engine.stop()
+    if auth_cache is not None:
+        await auth_cache.stop()
+    if db is not None:
+        await db.close()
+
+async def main():
+    global services_ready
+    services_ready = asyncio.Event()
+    # Connect to MongoDB while the Telegram client starts; commands that
+    # don't need the database (/start, /help) are answered right away
+    services = asyncio.ensure_future(start_services())
+    await app.start()
+    try:
+        await services
+        # Jobs reply through the client, so only dispatch once it is connected
+        await scheduler.start()
+        services_ready.set()
+        await idle()
+    finally:
+        services.cancel()
+        await app.stop()
+        await stop_services()
+        from utilities.http_client import close_http_client
+        await close_http_client()
+        shutdown_pools()
 
 if __name__ == "__main__":
     logger.info("Starting Advanced Course Portal Bot...")
-    app.run()
+    app.run(main())
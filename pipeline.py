@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_STATS_INTERVAL = 60
+
+
+def _cancelling() -> int:
+    """Pending cancellation requests of the current task (always 0 before Python 3.11)"""
+    cancelling = getattr(asyncio.current_task(), 'cancelling', None)
+    return cancelling() if cancelling else 0
+
+
+class _Item:
+    def __init__(self, value: Any, route: List[str], future: asyncio.Future):
+        self.value = value
+        self.route = route
+        self.future = future
+        # Stages run in the submitter's context (job priority, scratch directory)
+        self.context = contextvars.copy_context()
+
+
+class Stage:
+    """One step of the pipeline: a bounded inbox and a fixed set of workers"""
+
+    def __init__(self, name: str, fn: Callable[[Any], Awaitable[Any]], workers: int, queue_size: int):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.processed = 0
+        self.failed = 0
+        self._busy = 0.0
+        self._active: Dict[int, float] = {}
+        self._window_start = time.monotonic()
+
+    def snapshot(self, reset: bool = True) -> Dict:
+        """Counters since the last reset; utilization is busy time over worker time"""
+        now = time.monotonic()
+        busy = self._busy + sum(now - max(start, self._window_start) for start in self._active.values())
+        elapsed = max(now - self._window_start, 1e-9)
+        stats = {
+            'workers': self.workers,
+            'active': len(self._active),
+            'queued': self.queue.qsize(),
+            'processed': self.processed,
+            'failed': self.failed,
+            'utilization': busy / (elapsed * self.workers),
+        }
+        if reset:
+            self._busy = 0.0
+            self.processed = self.failed = 0
+            self._window_start = now
+        return stats
+
+
+class StagedPipeline:
+    """
+    Runs items through named stages connected by bounded queues
+
+    Every stage has its own worker count, so item N+1 can download while
+    item N encrypts and item N-1 uploads. A full queue blocks the stage
+    feeding it, which keeps slow stages from piling up work in memory. Each
+    item takes its own route through a subset of the stages, in pipeline
+    order, and submit() returns the value left by the last one.
+    """
+
+    def __init__(self, stages: Sequence[Tuple[str, Callable[[Any], Awaitable[Any]], int]],
+                 queue_size: Optional[int] = None, stats_interval: Optional[float] = None):
+        queue_size = queue_size or int(os.getenv("PIPELINE_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+        self.stats_interval = stats_interval or float(os.getenv("PIPELINE_STATS_INTERVAL", DEFAULT_STATS_INTERVAL))
+        self.stages: Dict[str, Stage] = {
+            name: Stage(name, fn, workers, queue_size) for name, fn, workers in stages
+        }
+        self.order = [name for name, _, _ in stages]
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        for stage in self.stages.values():
+            for index in range(stage.workers):
+                self._tasks.append(asyncio.ensure_future(self._work(stage, index)))
+        if self.stats_interval > 0:
+            self._tasks.append(asyncio.ensure_future(self._log_stats()))
+
+    async def stop(self):
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, value: Any, route: Optional[Sequence[str]] = None) -> Any:
+        """Send value through `route` (default: every stage) and await the result"""
+        route = [name for name in self.order if route is None or name in route]
+        future = asyncio.get_running_loop().create_future()
+        await self.stages[route[0]].queue.put(_Item(value, route, future))
+        return await future
+
+    async def _work(self, stage: Stage, index: int):
+        while True:
+            item = await stage.queue.get()
+            if item.future.done():
+                continue  # submitter gave up
+            stage._active[index] = time.monotonic()
+            task = item.context.run(asyncio.ensure_future, stage.fn(item.value))
+            # Abandoning the submit cancels the stage it is in
+            cancel = lambda _, task=task: task.cancel()
+            item.future.add_done_callback(cancel)
+            try:
+                item.value = await task
+                stage.processed += 1
+            except asyncio.CancelledError:
+                # Survive only a submitter giving up; stop() cancelling this worker must end it
+                if self._stopping or _cancelling() or not item.future.done():
+                    raise
+                continue
+            except Exception as e:
+                stage.failed += 1
+                if not item.future.done():
+                    item.future.set_exception(e)
+                continue
+            finally:
+                item.future.remove_done_callback(cancel)
+                stage._busy += time.monotonic() - max(stage._active.pop(index), stage._window_start)
+
+            position = item.route.index(stage.name)
+            if position + 1 < len(item.route):
+                await self.stages[item.route[position + 1]].queue.put(item)
+            elif not item.future.done():
+                item.future.set_result(item.value)
+
+    def snapshot(self, reset: bool = True) -> Dict[str, Dict]:
+        return {name: self.stages[name].snapshot(reset) for name in self.order}
+
+    def describe(self, stats: Optional[Dict[str, Dict]] = None) -> str:
+        stats = stats or self.snapshot(reset=False)
+        return ", ".join(
+            f"{name} {s['utilization']:.0%} of {s['workers']} ({s['queued']} queued, {s['processed']} done)"
+            for name, s in stats.items()
+        )
+
+    async def _log_stats(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            stats = self.snapshot()
+            if any(s['processed'] or s['failed'] or s['active'] for s in stats.values()):
+                logger.info(f"Pipeline utilization: {self.describe(stats)}")
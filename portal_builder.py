@@ -0,0 +1,117 @@
+import os
+import asyncio
+import logging
+from urllib.parse import urlparse
+from typing import (
+    AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+)
+from extractors import get_extractor
+from utilities.env_utils import parse_overrides
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+# Links read ahead of processing, as a multiple of the worker count
+BACKLOG_FACTOR = 16
+DEFAULT_PLATFORM_LIMITS = {
+    'utkarsh': 4,
+    'appx': 4,
+    'classplus': 4,
+    'generic': 2,  # applied per host for links handled by the universal extractor
+}
+
+
+def concurrency_key(url: str) -> str:
+    """Bucket a link by platform, or by host for generic links"""
+    extractor = get_extractor(url)
+    platform = getattr(extractor, 'PLATFORM', 'universal')
+    if platform == 'universal':
+        return f"generic:{urlparse(url).hostname or ''}"
+    return platform
+
+
+class PortalBuilder:
+    """
+    Runs a per-link coroutine over many links concurrently
+
+    A global limit caps total in-flight links and a per-platform limit keeps
+    any single origin from being hammered. Results come back in input order;
+    failures are returned as the raised exception instead of aborting the run.
+    """
+
+    def __init__(self, worker: Callable[[str], Awaitable[Dict]],
+                 max_workers: Optional[int] = None,
+                 platform_limits: Optional[Dict[str, int]] = None):
+        self.worker = worker
+        self.max_workers = max_workers or int(os.getenv("PORTAL_WORKERS", DEFAULT_WORKERS))
+        self.platform_limits = platform_limits or parse_overrides(
+            os.getenv("PORTAL_PLATFORM_LIMITS"), DEFAULT_PLATFORM_LIMITS
+        )
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def _slots_for(self, key: str) -> asyncio.Semaphore:
+        if key not in self._host_slots:
+            platform = key.split(':', 1)[0]
+            limit = self.platform_limits.get(platform, self.platform_limits['generic'])
+            self._host_slots[key] = asyncio.Semaphore(limit)
+        return self._host_slots[key]
+
+    async def run(self, links: Union[Iterable[str], AsyncIterable[str]],
+                  on_progress: Optional[Callable[[int, Optional[int], str, bool], Awaitable[None]]] = None
+                  ) -> List[Tuple[str, Union[Dict, Exception]]]:
+        """
+        Process all links and return (link, result) pairs in the original order
+        `links` may be an async iterator, so work starts before input is fully
+        read; `total` passed to on_progress stays None until the input ends
+        """
+        seen: List[str] = []
+        results: List[Union[Dict, Exception]] = []
+        global_slots = asyncio.Semaphore(self.max_workers)
+        # Bound how far input reading may run ahead of processing
+        backlog = asyncio.Semaphore(self.max_workers * BACKLOG_FACTOR)
+        total: Optional[int] = None
+        done = 0
+
+        async def handle(index: int, link: str):
+            nonlocal done
+            try:
+                # Wait for the origin first so queued links don't hold global slots
+                async with self._slots_for(concurrency_key(link)):
+                    async with global_slots:
+                        try:
+                            results[index] = await self.worker(link)
+                        except Exception as e:
+                            logger.error(f"Error processing link {link}: {str(e)}")
+                            results[index] = e
+            finally:
+                backlog.release()
+            done += 1
+            if on_progress:
+                try:
+                    await on_progress(done, total, link, not isinstance(results[index], Exception))
+                except Exception as e:
+                    logger.warning(f"Progress callback failed: {str(e)}")
+
+        tasks = []
+        try:
+            async for link in _as_async_iter(links):
+                await backlog.acquire()
+                seen.append(link)
+                results.append(None)
+                tasks.append(asyncio.ensure_future(handle(len(seen) - 1, link)))
+            total = len(seen)
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return list(zip(seen, results))
+
+
+async def _as_async_iter(links: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    if hasattr(links, '__aiter__'):
+        async for link in links:
+            yield link
+    else:
+        for link in links:
+            yield link
@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Set
+from pyrogram.errors import FloodWait, MessageNotModified
+
+logger = logging.getLogger(__name__)
+
+# Minimum seconds between edits of status messages in one chat
+DEFAULT_CHAT_INTERVAL = 3.0
+# Status edits per second across all chats
+DEFAULT_GLOBAL_RATE = 20.0
+
+
+def format_bytes(nbytes: float) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if nbytes < 1024.0:
+            return f"{nbytes:.1f} {unit}"
+        nbytes /= 1024.0
+    return f"{nbytes:.1f} TB"
+
+
+def render_transfer(label: str, done: int, total: int, rate: Optional[float] = None) -> str:
+    """"📥 Downloading: 45% (120.5 MB of 268.0 MB) at 8.2 MB/s"; just the byte count when the size is unknown"""
+    if total:
+        text = f"{label}: {done * 100 // total}% ({format_bytes(done)} of {format_bytes(total)})"
+    else:
+        text = f"{label}: {format_bytes(done)}"
+    if rate:
+        text += f" at {format_bytes(rate)}/s"
+    return text
+
+
+class EditLimiter:
+    """
+    Paces status message edits per chat and globally
+
+    Each chat gets at most one edit per `chat_interval` seconds, and a token
+    bucket caps edits across all chats. A FloodWait pushes the chat's next
+    edit back by the time Telegram asks for instead of sleeping on it.
+    """
+
+    def __init__(self, chat_interval: Optional[float] = None, global_rate: Optional[float] = None):
+        self.chat_interval = chat_interval or float(os.getenv("PROGRESS_CHAT_INTERVAL", DEFAULT_CHAT_INTERVAL))
+        self.global_rate = global_rate or float(os.getenv("PROGRESS_GLOBAL_RATE", DEFAULT_GLOBAL_RATE))
+        self._next_edit: Dict[int, float] = {}
+        self._tokens = self.global_rate
+        self._refilled = time.monotonic()
+        # Strong references to running flush tasks
+        self.tasks: Set[asyncio.Task] = set()
+
+    def wait_time(self, chat_id: int) -> float:
+        """Seconds until an edit in chat_id is allowed"""
+        now = time.monotonic()
+        self._tokens = min(self.global_rate, self._tokens + (now - self._refilled) * self.global_rate)
+        self._refilled = now
+        chat_wait = self._next_edit.get(chat_id, 0.0) - now
+        global_wait = (1 - self._tokens) / self.global_rate if self._tokens < 1 else 0.0
+        return max(chat_wait, global_wait, 0.0)
+
+    def record(self, chat_id: int):
+        self._tokens -= 1
+        self._next_edit[chat_id] = max(self._next_edit.get(chat_id, 0.0), time.monotonic() + self.chat_interval)
+
+    def defer(self, chat_id: int, seconds: float):
+        logger.warning(f"FloodWait of {seconds}s for chat {chat_id}, deferring status edits")
+        self._next_edit[chat_id] = time.monotonic() + seconds
+
+
+_limiter: Optional[EditLimiter] = None
+
+
+def get_edit_limiter() -> EditLimiter:
+    """Get the application-wide status edit limiter"""
+    global _limiter
+    if _limiter is None:
+        _limiter = EditLimiter()
+    return _limiter
+
+
+class ProgressReporter:
+    """
+    Status message that shows the latest progress without flooding Telegram
+
+    update() only records the text; a background task edits the message when
+    the limiter allows, skipping any texts superseded in the meantime, so
+    callers never wait on Telegram. Awaiting the reporter itself is the same
+    as update(), which makes it usable wherever a `status` coroutine function
+    is expected.
+    """
+
+    def __init__(self, message, limiter: Optional[EditLimiter] = None):
+        self.message = message
+        self.chat_id = message.chat.id
+        self.limiter = limiter or get_edit_limiter()
+        self._pending: Optional[str] = None
+        self._shown: Optional[str] = message.text
+        self._task: Optional[asyncio.Task] = None
+
+    async def __call__(self, text: str):
+        self.update(text)
+
+    def update(self, text: str):
+        self._pending = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush())
+            self.limiter.tasks.add(self._task)
+            self._task.add_done_callback(self.limiter.tasks.discard)
+
+    def transfer(self, label: str) -> Callable[[int, int], None]:
+        """Callback for (done_bytes, total_bytes) progress, called on the event loop"""
+        started = None
+
+        def on_progress(done: int, total: int):
+            nonlocal started
+            started = started or time.monotonic()
+            elapsed = time.monotonic() - started
+            # The rate is noise until the transfer has run for a moment
+            self.update(render_transfer(label, done, total, done / elapsed if elapsed >= 1 else None))
+        return on_progress
+
+    async def _flush(self):
+        while self._pending is not None and self._pending != self._shown:
+            wait = self.limiter.wait_time(self.chat_id)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            text = self._pending
+            self.limiter.record(self.chat_id)
+            try:
+                await self.message.edit_text(text)
+            except FloodWait as e:
+                self.limiter.defer(self.chat_id, e.value)
+                continue
+            except MessageNotModified:
+                pass
+            except Exception as e:
+                logger.warning(f"Status update failed: {str(e)}")
+            self._shown = text
+
+    async def flush(self):
+        """Wait until the latest text is shown"""
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def delete(self):
+        """Drop pending edits and delete the status message"""
+        if self._task is not None:
+            self._task.cancel()
+        self._pending = None
+        await self.message.delete()
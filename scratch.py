@@ -0,0 +1,287 @@
+import os
+import uuid
+import shutil
+import asyncio
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from utilities.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCRATCH_ROOT = ".scratch"
+# Kept free for the download cache, logs and everything else on the volume
+DEFAULT_DISK_RESERVE_MB = 1024
+# Assumed size of a download whose origin doesn't report one
+DEFAULT_UNKNOWN_SIZE_MB = 256
+
+
+class ScratchDir:
+    """
+    Private working directory for one job (or one portal item)
+
+    Downloads, DRM output and generated portals are written here through
+    scratch_path(), and the whole directory is removed on exit together with
+    the disk space it had reserved. Jobs never touch each other's files.
+    Directory names start with the owning process id so leftovers from a
+    crashed process can be recognised and removed on the next start.
+    """
+
+    def __init__(self, name: str, root: Optional[str] = None):
+        self.root = root or os.getenv("SCRATCH_DIR", DEFAULT_SCRATCH_ROOT)
+        self.path = os.path.join(self.root, f"{os.getpid()}-{name}-{uuid.uuid4().hex[:8]}")
+        self.reservations: List["Reservation"] = []
+        self._token = None
+
+    async def __aenter__(self) -> "ScratchDir":
+        os.makedirs(self.path)
+        self._token = current_scratch.set(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        current_scratch.reset(self._token)
+        await asyncio.get_running_loop().run_in_executor(None, shutil.rmtree, self.path, True)
+        reservations, self.reservations = self.reservations, []
+        for reservation in reservations:
+            reservation.release()
+
+    def hold(self, reservation: "Reservation"):
+        """Keep a reservation made elsewhere until this directory is removed"""
+        reservation.holders += 1
+        self.reservations.append(reservation)
+
+    def release(self, reservation: "Reservation"):
+        """Let go of a reservation before the directory is removed"""
+        if reservation in self.reservations:
+            self.reservations.remove(reservation)
+            reservation.release()
+
+
+current_scratch: ContextVar[Optional[ScratchDir]] = ContextVar("current_scratch", default=None)
+
+
+def scratch_path(file_name: str) -> str:
+    """Path for a temporary file of the current job; the working directory outside jobs"""
+    scratch = current_scratch.get()
+    return os.path.join(scratch.path, file_name) if scratch else file_name
+
+
+def link_into(path: str, directory: str) -> str:
+    """Hard link (or copy) a file into directory, returning the new path"""
+    if os.path.dirname(os.path.abspath(path)) == os.path.abspath(directory):
+        return path
+    target = os.path.join(directory, os.path.basename(path))
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(path, target)
+    except OSError:
+        shutil.copyfile(path, target)
+    return target
+
+
+def adopt(path: str) -> str:
+    """Hard link a file produced elsewhere into the current scratch directory"""
+    scratch = current_scratch.get()
+    return link_into(path, scratch.path) if scratch else path
+
+
+class ScratchFlight:
+    """
+    SingleFlight for work that writes files
+
+    The shared work runs in a scratch directory of its own, which also holds
+    the disk space reserved inside it, instead of borrowing the directory of
+    whichever requester came first; a requester that leaves early can't pull
+    files out from under the others. Before the work finishes, `relink`
+    places its output in the scratch directory of every requester still
+    waiting, and each of those directories also holds the flight's
+    reservations, since the links keep the bytes on disk. Then the flight's
+    directory goes and lets go of its own hold.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.flight = SingleFlight(name)
+        self._sharers: Dict[str, List[Tuple[object, Optional[ScratchDir]]]] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return self.flight.in_flight(key)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]],
+                 relink: Callable[[Any, str], Any]) -> Any:
+        """
+        Run fn() for key, or join the run already in flight
+        `relink(result, directory)` returns the result with its files linked
+        into directory, usually through link_into()
+        """
+        if not self.flight.in_flight(key):
+            self._sharers[key] = []
+        sharers = self._sharers[key]
+        sharer = (object(), current_scratch.get())
+        sharers.append(sharer)
+        try:
+            results = await self.flight.do(key, lambda: self._run(key, sharers, fn, relink))
+        finally:
+            sharers.remove(sharer)
+        return results[sharer[0]]
+
+    async def _run(self, key: str, sharers: List[Tuple[object, Optional[ScratchDir]]],
+                   fn: Callable[[], Awaitable[Any]], relink: Callable[[Any, str], Any]) -> Dict[object, Any]:
+        try:
+            async with ScratchDir(self.name.replace(' ', '-')) as own:
+                result = await fn()
+                # No awaits from here on, so nobody joins or leaves while linking
+                results = {}
+                for token, scratch in sharers:
+                    results[token] = relink(result, scratch.path if scratch else '.')
+                    if scratch is not None:
+                        for reservation in own.reservations:
+                            scratch.hold(reservation)
+                return results
+        finally:
+            if self._sharers.get(key) is sharers:
+                del self._sharers[key]
+
+
+def remove_stale_scratch(root: Optional[str] = None):
+    """Delete scratch directories left behind by processes that are gone"""
+    root = root or os.getenv("SCRATCH_DIR", DEFAULT_SCRATCH_ROOT)
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        pid = name.split('-', 1)[0]
+        if pid.isdigit() and not _process_alive(int(pid)):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            logger.info(f"Removed stale scratch directory {name}")
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Reservation:
+    """
+    Space taken from a DiskBudget; several scratch directories may hold hard
+    links to the same files, so it is returned when the last holder lets go
+    """
+
+    def __init__(self, budget: "DiskBudget", nbytes: int):
+        self.budget = budget
+        self.nbytes = nbytes
+        self.holders = 1
+
+    def release(self):
+        if self.holders > 0:
+            self.holders -= 1
+            if self.holders == 0:
+                self.budget._release(self.nbytes)
+
+
+class DiskBudget:
+    """
+    Admission control for scratch disk space
+
+    Each download reserves the bytes it is expected to occupy before it
+    starts and waits, in arrival order, while the budget is used up. The
+    reservation is held by the current scratch directory, and by every
+    directory a shared result is linked into, until the last of them is
+    removed. A reservation larger than the whole budget is
+    admitted once nothing else holds space, so it can't wait forever.
+    """
+
+    def __init__(self, budget_bytes: Optional[int] = None, root: Optional[str] = None):
+        self.root = root or os.getenv("SCRATCH_DIR", DEFAULT_SCRATCH_ROOT)
+        if budget_bytes is None:
+            budget_mb = int(os.getenv("DISK_BUDGET_MB", 0))
+            budget_bytes = budget_mb * 1024 * 1024 if budget_mb else self._free_space()
+        self.budget = budget_bytes
+        self.reserved = 0
+        self._waiters: List[Tuple[int, asyncio.Future]] = []
+
+    def _free_space(self) -> int:
+        os.makedirs(self.root, exist_ok=True)
+        reserve = int(os.getenv("DISK_RESERVE_MB", DEFAULT_DISK_RESERVE_MB)) * 1024 * 1024
+        return max(shutil.disk_usage(self.root).free - reserve, 0)
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.reserved + nbytes <= self.budget or self.reserved == 0
+
+    async def reserve(self, nbytes: int) -> Reservation:
+        """
+        Wait until nbytes fit in the budget and charge them to the current
+        scratch directory; outside one, release() the reservation yourself
+        """
+        if self._waiters or not self._fits(nbytes):
+            logger.info(f"Waiting for {nbytes / 2 ** 20:.0f} MB of scratch space "
+                        f"({self.reserved / 2 ** 20:.0f} of {self.budget / 2 ** 20:.0f} MB reserved)")
+            entry = (nbytes, asyncio.get_running_loop().create_future())
+            waiter = entry[1]
+            self._waiters.append(entry)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+                elif not waiter.cancelled():
+                    self._release(nbytes)  # admitted just as we were cancelled
+                self._wake()
+                raise
+        else:
+            self.reserved += nbytes
+
+        reservation = Reservation(self, nbytes)
+        scratch = current_scratch.get()
+        if scratch is not None:
+            scratch.reservations.append(reservation)
+        return reservation
+
+    def _release(self, nbytes: int):
+        self.reserved -= nbytes
+        self._wake()
+
+    def _wake(self):
+        # Strict arrival order: a large download isn't starved by smaller ones
+        while self._waiters and self._fits(self._waiters[0][0]):
+            nbytes, waiter = self._waiters.pop(0)
+            self.reserved += nbytes
+            waiter.set_result(None)
+
+    def stats(self) -> Dict[str, int]:
+        return {'budget': self.budget, 'reserved': self.reserved, 'waiting': len(self._waiters)}
+
+
+async def expected_size(content_info: Dict) -> int:
+    """
+    Bytes a download will occupy on disk: the selected quality's size, else
+    the origin's Content-Length, else DISK_UNKNOWN_SIZE_MB
+    """
+    size = 0
+    url = content_info.get('preferred_quality') or content_info.get('download_url') or content_info.get('stream_url')
+    for quality in content_info.get('qualities') or []:
+        if quality.get('url') == url and quality.get('size_bytes'):
+            size = int(quality['size_bytes'])
+    if not size:
+        from utilities.download_cache import get_download_cache
+        length = (await get_download_cache().probe(url)).get('content_length') or ''
+        size = int(length) if length.isdigit() else 0
+    if not size:
+        size = int(os.getenv("DISK_UNKNOWN_SIZE_MB", DEFAULT_UNKNOWN_SIZE_MB)) * 1024 * 1024
+    return size
+
+
+_disk_budget: Optional[DiskBudget] = None
+
+
+def get_disk_budget() -> DiskBudget:
+    """Get the application-wide disk budget"""
+    global _disk_budget
+    if _disk_budget is None:
+        _disk_budget = DiskBudget()
+    return _disk_budget
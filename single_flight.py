@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one
+
+    The first caller starts the work; callers that arrive while it is still
+    running await the same result or exception. Nothing is remembered once
+    the call completes. The work keeps running while anyone is waiting for
+    it and is cancelled when the last waiter goes away.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        # Calls that joined an in-flight one instead of starting their own
+        self.shared = 0
+
+    def in_flight(self, key: str) -> bool:
+        call = self._calls.get(key)
+        return call is not None and not call.task.done()
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run fn() for key, or join the run already in flight"""
+        call = self._calls.get(key)
+        # A finished call may linger until its done callback runs; never join it
+        if call is None or call.task.done():
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.shared += 1
+            logger.info(f"Joined in-flight {self.name} for {key}")
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
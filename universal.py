@@ -1,5 +1,4 @@
 import re
-import aiohttp
 from typing import Optional, Dict
 from extractors.base_extractor import BaseExtractor
 
@@ -9,7 +8,7 @@ class UniversalExtractor(BaseExtractor):
     def is_valid_url(self, url: str) -> bool:
         return bool(re.match(r'https?://\S+', url))
     
-    async def extract(self, url: str) -> Dict:
+    async def extract_content(self, url: str) -> Dict:
         """Universal extractor for direct video/PDF links"""
         content_type = await self._detect_content_type(url)
         
@@ -26,16 +25,16 @@ class UniversalExtractor(BaseExtractor):
             return 'document'
         
         # Check via HEAD request
-        async with aiohttp.ClientSession() as session:
-            async with session.head(url) as resp:
-                content_type = resp.headers.get('Content-Type', '').lower()
-                
-                if 'video' in content_type:
-                    return 'video'
-                elif 'application/pdf' in content_type:
-                    return 'document'
-                elif 'm3u8' in content_type or 'mpd' in content_type:
-                    return 'video'
+        session = await self.get_session()
+        async with session.head(url) as resp:
+            content_type = resp.headers.get('Content-Type', '').lower()
+            
+            if 'video' in content_type:
+                return 'video'
+            elif 'application/pdf' in content_type:
+                return 'document'
+            elif 'm3u8' in content_type or 'mpd' in content_type:
+                return 'video'
         
         # Fallback to URL pattern
         if re.search(r'\.(mp4|m3u8|mpd|mov|avi|mkv)$', url, re.I):
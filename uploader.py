@@ -0,0 +1,224 @@
+import io
+import os
+import math
+import time
+import asyncio
+import inspect
+import logging
+from pathlib import PurePath
+from typing import Callable, List, Optional
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from pyrogram.session import Session
+
+logger = logging.getLogger(__name__)
+
+PART_SIZE = 512 * 1024
+# Telegram takes files above this as "big" files uploaded with SaveBigFilePart
+BIG_FILE_SIZE = 10 * 1024 * 1024
+DEFAULT_WORKERS = 8
+DEFAULT_SESSIONS = 1
+# Telegram's upload limit for bots is 2000 MiB
+DEFAULT_SPLIT_MB = 2000
+PART_RETRIES = 5
+
+
+class FileRange(io.RawIOBase):
+    """
+    Read-only view of `length` bytes of a file starting at `offset`
+
+    Lets an oversized file be sent as several Telegram documents without
+    writing the pieces to disk; Pyrogram treats it like any open file.
+    """
+
+    def __init__(self, path: str, offset: int = 0, length: Optional[int] = None, name: Optional[str] = None):
+        super().__init__()
+        self.path = path
+        self.offset = offset
+        self.length = os.path.getsize(path) - offset if length is None else length
+        self.name = name or os.path.basename(path)
+        self._file = open(path, 'rb')
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.length}[whence]
+        self._position = max(0, min(base + position, self.length))
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.length - self._position)
+        if size <= 0:
+            return 0
+        data = os.pread(self._file.fileno(), size, self.offset + self._position)
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+def split_file(path: str, max_bytes: Optional[int] = None) -> List[FileRange]:
+    """
+    Cut a file into consecutive ranges no larger than max_bytes
+    Parts are named <file>.001, <file>.002, ... so they sort in joining order
+    """
+    max_bytes = max_bytes or int(os.getenv("UPLOAD_SPLIT_MB", DEFAULT_SPLIT_MB)) * 1024 * 1024
+    # Whole parts keep every Telegram file part full except each file's last
+    max_bytes -= max_bytes % PART_SIZE
+    size = os.path.getsize(path)
+    count = max(1, math.ceil(size / max_bytes))
+    if count == 1:
+        return [FileRange(path)]
+    base = os.path.basename(path)
+    return [
+        FileRange(path, index * max_bytes, min(max_bytes, size - index * max_bytes), f"{base}.{index + 1:03d}")
+        for index in range(count)
+    ]
+
+
+class UploadEngine:
+    """
+    Parallel uploader for large files
+
+    Installed as the client's save_file, so send_video/send_document use it
+    transparently. Files above BIG_FILE_SIZE are uploaded as parts by
+    UPLOAD_WORKERS concurrent workers spread across UPLOAD_SESSIONS media
+    connections; each part is read with pread when its worker is ready, so at
+    most one part per worker is held in memory. Failed parts are retried,
+    progress counts only parts Telegram has accepted, and every upload logs
+    its throughput. Small files and single-part retries go through Pyrogram.
+    """
+
+    def __init__(self, client, workers: Optional[int] = None, sessions: Optional[int] = None):
+        self.client = client
+        self.workers = workers or int(os.getenv("UPLOAD_WORKERS", DEFAULT_WORKERS))
+        self.session_count = sessions or int(os.getenv("UPLOAD_SESSIONS", DEFAULT_SESSIONS))
+        self._sessions: List[Session] = []
+        self._sessions_lock = asyncio.Lock()
+        self._pyrogram_save_file = None
+        # Totals for throughput reporting
+        self.uploaded_bytes = 0
+        self.upload_seconds = 0.0
+
+    def install(self):
+        self._pyrogram_save_file = self.client.save_file
+        self.client.save_file = self.save_file
+
+    async def stop(self):
+        for session in self._sessions:
+            await session.stop()
+        self._sessions = []
+
+    async def _get_sessions(self) -> List[Session]:
+        async with self._sessions_lock:
+            if not self._sessions:
+                storage = self.client.storage
+                for _ in range(self.session_count):
+                    session = Session(self.client, await storage.dc_id(), await storage.auth_key(),
+                                      await storage.test_mode(), is_media=True)
+                    await session.start()
+                    self._sessions.append(session)
+            return self._sessions
+
+    async def save_file(self, path, file_id: Optional[int] = None, file_part: int = 0,
+                        progress: Optional[Callable] = None, progress_args: tuple = ()):
+        """Drop-in replacement for Client.save_file"""
+        if isinstance(path, FileRange):
+            source = path
+        elif isinstance(path, (str, PurePath)) and os.path.isfile(path):
+            source = FileRange(str(path))
+        else:
+            source = None
+
+        if source is None or file_id is not None or source.length <= BIG_FILE_SIZE:
+            if source is not None and source is not path:
+                source.close()
+            return await self._pyrogram_save_file(path, file_id=file_id, file_part=file_part,
+                                                  progress=progress, progress_args=progress_args)
+        try:
+            return await self._save_big_file(source, progress, progress_args)
+        finally:
+            if source is not path:
+                source.close()
+
+    async def _save_big_file(self, source: FileRange, progress: Optional[Callable], progress_args: tuple):
+        loop = asyncio.get_running_loop()
+        sessions = await self._get_sessions()
+        file_id = self.client.rnd_id()
+        total_parts = math.ceil(source.length / PART_SIZE)
+        parts = iter(range(total_parts))
+        fd = source._file.fileno()
+        done = 0
+        start = time.monotonic()
+
+        async def report():
+            if progress is None:
+                return
+            if inspect.iscoroutinefunction(progress):
+                await progress(done, source.length, *progress_args)
+            else:
+                await loop.run_in_executor(None, progress, done, source.length, *progress_args)
+
+        async def worker(session: Session):
+            nonlocal done
+            for index in parts:
+                offset = index * PART_SIZE
+                size = min(PART_SIZE, source.length - offset)
+                chunk = await loop.run_in_executor(None, os.pread, fd, size, source.offset + offset)
+                await self._send_part(session, raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id, file_part=index, file_total_parts=total_parts, bytes=chunk
+                ))
+                done += len(chunk)
+                await report()
+
+        tasks = [
+            asyncio.ensure_future(worker(sessions[n % len(sessions)]))
+            for n in range(min(self.workers, total_parts))
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        elapsed = max(time.monotonic() - start, 1e-6)
+        self.uploaded_bytes += source.length
+        self.upload_seconds += elapsed
+        logger.info(f"Uploaded {source.name}: {source.length / 2 ** 20:.1f} MB in {elapsed:.1f}s "
+                    f"({source.length / 2 ** 20 / elapsed:.1f} MB/s, {len(tasks)} parts at once "
+                    f"over {len(sessions)} connection(s))")
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=source.name)
+
+    async def _send_part(self, session: Session, request):
+        for attempt in range(PART_RETRIES + 1):
+            try:
+                if await session.invoke(request):
+                    return
+                error = Exception("Telegram rejected the file part")
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+                continue
+            except (OSError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt < PART_RETRIES:
+                logger.warning(f"Upload of part {request.file_part} failed ({str(error)}), retrying")
+                await asyncio.sleep(attempt + 1)
+        raise Exception(f"Upload of part {request.file_part} failed after {PART_RETRIES + 1} attempts")
+
+    def throughput(self) -> float:
+        """Average MB/s of large uploads so far"""
+        return self.uploaded_bytes / 2 ** 20 / self.upload_seconds if self.upload_seconds else 0.0
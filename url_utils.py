@@ -0,0 +1,29 @@
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a link was shared from; generic
+# names such as ref or si are left alone since some sites use them for content
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'igshid'}
+TRACKING_PREFIXES = ('utm_', 'mc_')
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL: lowercase scheme/host, no default port, no fragment"""
+    parts = urlsplit(url.strip())
+    netloc = parts.netloc.lower()
+    if parts.scheme == 'https' and netloc.endswith(':443'):
+        netloc = netloc[:-4]
+    elif parts.scheme == 'http' and netloc.endswith(':80'):
+        netloc = netloc[:-3]
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path or '/', parts.query, ''))
+
+
+def canonical_link(url: str) -> str:
+    """normalize_url with tracking parameters removed, used to spot duplicate links"""
+    parts = urlsplit(normalize_url(url))
+    if not parts.query:
+        return urlunsplit(parts)
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunsplit(parts._replace(query=urlencode(query)))
@@ -0,0 +1,19 @@
+"""
+Job worker
+
+Processes queued link and portal jobs without handling Telegram updates.
+Run as many as needed, on one machine or several, with the same settings as
+the bot; they share the MongoDB jobs collection and claim work through
+leases. Set JOB_WORKERS=0 on the bot to leave all processing to workers.
+
+Usage: python worker.py
+"""
+import os
+
+os.environ["BOT_MODE"] = "worker"
+
+import main
+
+if __name__ == "__main__":
+    main.logger.info("Starting job worker...")
+    main.app.run(main.main())
@@ -0,0 +1,220 @@
+import os
+import uuid
+import heapq
+import asyncio
+import logging
+import tempfile
+import itertools
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CANCEL_DIR = os.path.join(tempfile.gettempdir(), "drm_bot_cancel")
+
+# Priority of the job the current task works for (lower runs first); set by
+# the job scheduler and inherited by every task the job spawns
+job_priority: ContextVar[int] = ContextVar('job_priority', default=0)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job has been cancelled"""
+
+
+class CancelToken:
+    """
+    Cross-process cancellation flag backed by a sentinel file
+    Picklable, so it can be handed to a job running in another process
+    """
+
+    def __init__(self):
+        self.path = os.path.join(CANCEL_DIR, uuid.uuid4().hex)
+
+    def cancel(self):
+        os.makedirs(CANCEL_DIR, exist_ok=True)
+        with open(self.path, 'w'):
+            pass
+
+    def is_cancelled(self) -> bool:
+        return os.path.exists(self.path)
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise JobCancelled()
+
+    def discard(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class _PriorityGate:
+    """Semaphore that admits waiters by (priority, arrival) instead of arrival alone"""
+
+    def __init__(self, slots: int):
+        self._free = slots
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._arrivals = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self._free > 0:
+            self._free -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we were cancelled
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._free += 1
+
+
+class WorkerPool(ABC):
+    """
+    Bounded executor wrapper shared by the CPU and blocking-I/O stages
+
+    At most `max_pending` jobs may be queued or running at once; further
+    submitters wait, which gives natural backpressure to the handlers.
+    Waiters are admitted in job_priority order, so a bulk portal can't
+    starve a single-link request.
+    Cancelling the awaiting task cancels the job: queued jobs are dropped and
+    running jobs are signalled through their CancelToken.
+    """
+
+    name = "worker"
+
+    def __init__(self, max_workers: int, max_pending: Optional[int] = None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending or self.max_workers * 2
+        self._executor: Optional[Executor] = None
+        self._slots: Optional[_PriorityGate] = None
+        self.pending = 0
+
+    @abstractmethod
+    def _create_executor(self) -> Executor:
+        pass
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._create_executor()
+        return self._executor
+
+    async def run(self, fn: Callable, *args, cancel_token: Optional[CancelToken] = None, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) in the pool and await the result"""
+        if self._slots is None:
+            self._slots = _PriorityGate(self.max_pending)
+        if cancel_token is not None:
+            kwargs['cancel_token'] = cancel_token
+
+        await self._slots.acquire(job_priority.get())
+        self.pending += 1
+        try:
+            try:
+                job = self._get_executor().submit(_call, fn, args, kwargs)
+            except BrokenExecutor:
+                logger.warning(f"{self.name} pool was broken, restarting it")
+                self._executor = None
+                job = self._get_executor().submit(_call, fn, args, kwargs)
+
+            try:
+                return await asyncio.wrap_future(job)
+            except asyncio.CancelledError:
+                # Drop the job if it is still queued, otherwise tell the worker to stop
+                if not job.cancel() and cancel_token is not None:
+                    cancel_token.cancel()
+                    # _call may already be past its cleanup, so remove the flag once the job is over
+                    job.add_done_callback(lambda _: cancel_token.discard())
+                raise
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+    def shutdown(self):
+        """Stop workers, dropping jobs that have not started"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class CryptoWorkerPool(WorkerPool):
+    """Process pool for CPU-heavy stages (encryption, hashing)"""
+
+    name = "Crypto"
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        super().__init__(
+            max_workers or int(os.getenv("CRYPTO_WORKERS", os.cpu_count() or 1)),
+            max_pending or int(os.getenv("CRYPTO_QUEUE_SIZE", 0)) or None,
+        )
+
+    def _create_executor(self) -> Executor:
+        return ProcessPoolExecutor(max_workers=self.max_workers)
+
+
+class DownloadWorkerPool(WorkerPool):
+    """
+    Thread pool for blocking download libraries such as yt-dlp
+    Threads rather than processes so progress hooks can reach the event loop
+    """
+
+    name = "Download"
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: Optional[int] = None):
+        super().__init__(
+            max_workers or int(os.getenv("YTDLP_WORKERS", 2)),
+            max_pending or int(os.getenv("YTDLP_QUEUE_SIZE", 0)) or None,
+        )
+
+    def _create_executor(self) -> Executor:
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ytdlp")
+
+
+def _call(fn: Callable, args: tuple, kwargs: dict) -> Any:
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        cancel_token = kwargs.get('cancel_token')
+        if cancel_token is not None:
+            cancel_token.discard()
+
+
+_crypto_pool: Optional[CryptoWorkerPool] = None
+
+
+def get_crypto_pool() -> CryptoWorkerPool:
+    """Get the application-wide crypto worker pool"""
+    global _crypto_pool
+    if _crypto_pool is None:
+        _crypto_pool = CryptoWorkerPool()
+    return _crypto_pool
+
+
+_download_pool: Optional[DownloadWorkerPool] = None
+
+
+def get_download_pool() -> DownloadWorkerPool:
+    """Get the application-wide blocking download pool"""
+    global _download_pool
+    if _download_pool is None:
+        _download_pool = DownloadWorkerPool()
+    return _download_pool
+
+
+def shutdown_pools():
+    """Shut down every pool that has been started"""
+    for pool in (_crypto_pool, _download_pool):
+        if pool is not None:
+            pool.shutdown()